@@ -0,0 +1,171 @@
+"""Throughput and latency of the API against a local Pushbullet stub.
+
+Requests are made in-process through the WSGI app, so the numbers include
+the app and real HTTP calls to the stub, but not a WSGI server.
+
+    python -m benchmarks.api --latency-ms 20 --rate-429 0.01
+"""
+import argparse
+import json
+import threading
+import time
+from falcon import testing
+from push_notifications import server
+from push_notifications.pushbullet_api import PushbulletAPI
+from push_notifications.scheduler import DeliveryScheduler
+from push_notifications.storage.in_memory_storage import InMemoryStorage
+from benchmarks.harness import measure, write_results, default_output, \
+    print_table
+from benchmarks.pushbullet_stub import PushbulletStub, add_stub_arguments, \
+    config_from_arguments
+
+SCENARIOS = ("register_users", "single_push", "group_fanout",
+             "multi_group_broadcast", "urgent_during_broadcast",
+             "stream_ingest", "list_users")
+
+
+def _post(app, path, data):
+    return testing.simulate_post(app, path, body=json.dumps(data))
+
+
+def run_scenarios(app, storage, args, names=SCENARIOS, scheduler=None):
+    """Run the named scenarios against app, returning their summaries.
+    Pass the app's scheduler to have urgent_during_broadcast wait until
+    the broadcast is queued before measuring."""
+    results = {}
+    users = ["user%d" % i for i in range(args.users)]
+
+    def register(i):
+        result = _post(app, "/v1/users", {"username": users[i],
+                                          "accessToken": "token%d" % i})
+        return result.status_code == 201
+
+    # Every other scenario needs the users, so they are always registered.
+    summary = measure(register, len(users), args.concurrency)
+    if "register_users" in names:
+        results["register_users"] = summary
+
+    group_ids = []
+    for g in range(args.groups):
+        group_id = "group%d" % g
+        members = users[g * args.group_size % len(users):][:args.group_size]
+        storage.register_group(group_id, members)
+        group_ids.append(group_id)
+
+    if "single_push" in names:
+        def single_push(i):
+            result = _post(app, "/v1/users/%s/notifications" %
+                           users[i % len(users)],
+                           {"title": "title", "body": "body"})
+            return result.status_code == 201
+        results["single_push"] = measure(single_push, args.requests,
+                                         args.concurrency)
+
+    if "group_fanout" in names:
+        def group_fanout(i):
+            result = _post(app, "/v1/groups/%s/notifications" %
+                           group_ids[i % len(group_ids)],
+                           {"title": "title", "body": "body"})
+            return result.status_code == 201 and not result.json["errors"]
+        results["group_fanout"] = measure(group_fanout, args.fanouts,
+                                          args.concurrency)
+
+    if "multi_group_broadcast" in names:
+        def broadcast(i):
+            result = _post(app, "/v1/notifications",
+                           {"groupIds": group_ids, "title": "title",
+                            "body": "body"})
+            return result.status_code == 201 and not result.json["errors"]
+        results["multi_group_broadcast"] = measure(broadcast, args.fanouts,
+                                                   args.concurrency)
+
+    if "urgent_during_broadcast" in names:
+        # Single pushes measured while multi-group broadcasts keep the bulk
+        # lane full; their p99 should stay close to single_push's.
+        stop = threading.Event()
+        broadcasts = []
+
+        def keep_broadcasting():
+            while not stop.is_set():
+                _post(app, "/v1/notifications",
+                      {"groupIds": group_ids, "title": "title",
+                       "body": "body"})
+                broadcasts.append(1)
+
+        broadcaster = threading.Thread(target=keep_broadcasting)
+        broadcaster.start()
+        deadline = time.perf_counter() + 5
+        while (scheduler is not None and time.perf_counter() < deadline and
+               not scheduler.stats()["bulk"]["depth"]):
+            time.sleep(0.001)
+
+        def urgent_push(i):
+            result = _post(app, "/v1/users/%s/notifications" %
+                           users[i % len(users)],
+                           {"title": "title", "body": "body"})
+            return result.status_code == 201
+        summary = measure(urgent_push, args.requests, args.concurrency)
+        stop.set()
+        broadcaster.join()
+        summary["broadcasts"] = len(broadcasts)
+        results["urgent_during_broadcast"] = summary
+
+    if "stream_ingest" in names:
+        def stream_ingest(i):
+            body = "".join(json.dumps({"username": users[j % len(users)],
+                                       "title": "title", "body": "body"}) +
+                           "\n" for j in range(i, i + args.stream_size))
+            result = testing.simulate_post(app, "/v1/notifications/stream",
+                                           body=body)
+            summary = json.loads(result.text.splitlines()[-1])["summary"]
+            return result.status_code == 200 and not summary["failed"]
+        summary = measure(stream_ingest, args.fanouts, args.concurrency)
+        summary["recordsPerSec"] = round(
+            summary["reqPerSec"] * args.stream_size, 2)
+        results["stream_ingest"] = summary
+
+    if "list_users" in names:
+        def list_users(i):
+            return testing.simulate_get(app, "/v1/users").status_code == 200
+        results["list_users"] = measure(list_users, args.requests,
+                                        args.concurrency)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--groups", type=int, default=4)
+    parser.add_argument("--group-size", type=int, default=250)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--fanouts", type=int, default=4)
+    parser.add_argument("--stream-size", type=int, default=1000,
+                        help="records per stream_ingest request")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=8,
+                        help="delivery scheduler worker threads")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="run only these scenarios")
+    parser.add_argument("--output", help="where to save the JSON results")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    with PushbulletStub(config_from_arguments(args)) as stub:
+        storage = InMemoryStorage()
+        scheduler = DeliveryScheduler(workers=args.workers)
+        app = server.setup_api(storage, PushbulletAPI(stub.url), scheduler)
+        scenarios = run_scenarios(app, storage, args,
+                                  args.scenario or SCENARIOS, scheduler)
+        scheduler.shutdown()
+        stub_stats = stub.stats()
+
+    print_table(scenarios)
+    output = args.output or default_output("api")
+    config = dict(vars(args), stub=stub_stats)
+    write_results(output, "api", config, scenarios)
+    print("Results saved to %s" % output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Local multi-process cluster of storage nodes.
+
+Starts storage nodes as separate processes on localhost and uses them
+through ShardedStorage.
+
+* check: registers users and groups, increments counters from several
+  threads, adds a node and checks that nothing was lost in the rebalance.
+* throughput: for each node count, client processes run a mix of lookups
+  and increments against the cluster; ops/s should grow close to linearly
+  with the node count, given enough cores for the nodes and clients.
+
+    python -m benchmarks.cluster --nodes 1 2 4 --clients 8
+"""
+import argparse
+import multiprocessing
+import socket
+import subprocess
+import sys
+import threading
+import time
+from push_notifications.storage.remote_storage import RemoteStorage
+from push_notifications.storage.sharded_storage import ShardedStorage
+from benchmarks.harness import write_results, default_output
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Cluster:
+    """Storage node processes on localhost."""
+
+    def __init__(self):
+        self._processes = []
+        self.urls = []
+
+    def start_node(self):
+        """Start a node process and wait until it answers.
+        Returns its URL."""
+        port = _free_port()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "push_notifications.storage.node",
+             "--port", str(port)])
+        self._processes.append(process)
+        url = "http://127.0.0.1:%d" % port
+        client = RemoteStorage(url, timeout=1)
+        for _ in range(100):
+            try:
+                client.get_group_ids()
+                break
+            except Exception:
+                time.sleep(0.05)
+        else:
+            raise RuntimeError("Node on port %d did not start" % port)
+        self.urls.append(url)
+        return url
+
+    def storage(self):
+        return ShardedStorage({url: RemoteStorage(url) for url in self.urls})
+
+    def stop(self):
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def check(args):
+    """Check correctness across a rebalance. Returns a list of problems."""
+    problems = []
+    with Cluster() as cluster:
+        for _ in range(args.check_nodes):
+            cluster.start_node()
+        storage = cluster.storage()
+        users = ["user%d" % i for i in range(args.users)]
+        for user in users:
+            storage.register_user(user, "token")
+        for g in range(10):
+            storage.register_group("group%d" % g, users[g::10])
+
+        def increment(offset):
+            for user in users[offset::4]:
+                storage.increment_notifications_pushed(user)
+        threads = [threading.Thread(target=increment, args=(i,))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        # Rebalance while the increments are running.
+        moved = storage.add_node(cluster.start_node(),
+                                 RemoteStorage(cluster.urls[-1]))
+        for thread in threads:
+            thread.join()
+
+        if len(storage.get_users()) != len(users):
+            problems.append("expected %d users, found %d" %
+                            (len(users), len(storage.get_users())))
+        for user in users:
+            count = storage.get_by_username(user)["numOfNotificationsPushed"]
+            if count != 1:
+                problems.append("%s has count %d" % (user, count))
+        for g in range(10):
+            if storage.get_group("group%d" % g) != users[g::10]:
+                problems.append("group%d changed" % g)
+        print("check: moved %d users and %d groups onto the new node, "
+              "%d problems" % (moved[0], moved[1], len(problems)))
+    return problems
+
+
+def _client(urls, users, duration, threads, results):
+    """Run lookups and increments for duration seconds from threads."""
+    storage = ShardedStorage({url: RemoteStorage(url) for url in urls})
+    counts = [0] * threads
+    deadline = time.perf_counter() + duration
+
+    def work(index):
+        i = index
+        while time.perf_counter() < deadline:
+            user = users[i % len(users)]
+            if i % 2:
+                storage.increment_notifications_pushed(user)
+            else:
+                storage.get_by_username(user)
+            counts[index] += 1
+            i += threads
+
+    workers = [threading.Thread(target=work, args=(i,))
+               for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    results.put(sum(counts))
+
+
+def throughput(nodes, args):
+    with Cluster() as cluster:
+        for _ in range(nodes):
+            cluster.start_node()
+        storage = cluster.storage()
+        users = ["user%d" % i for i in range(args.users)]
+        for user in users:
+            storage.register_user(user, "token")
+
+        results = multiprocessing.Queue()
+        clients = [multiprocessing.Process(
+            target=_client,
+            args=(cluster.urls, users, args.duration, args.threads, results))
+            for _ in range(args.clients)]
+        for client in clients:
+            client.start()
+        operations = sum(results.get() for _ in clients)
+        for client in clients:
+            client.join()
+    return {
+        "nodes": nodes,
+        "operations": operations,
+        "seconds": args.duration,
+        "opsPerSec": round(operations / args.duration, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nodes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=8,
+                        help="client processes")
+    parser.add_argument("--threads", type=int, default=4,
+                        help="threads per client process")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--check-nodes", type=int, default=3)
+    parser.add_argument("--skip-check", action="store_true")
+    parser.add_argument("--output", help="where to save the JSON results")
+    args = parser.parse_args()
+
+    problems = [] if args.skip_check else check(args)
+    for problem in problems:
+        print("  %s" % problem)
+
+    scenarios = {}
+    base = None
+    for nodes in args.nodes:
+        result = throughput(nodes, args)
+        if base is None:
+            base = result["opsPerSec"] / nodes
+        result["scalingEfficiency"] = round(
+            result["opsPerSec"] / (base * nodes), 3) if base else 0.0
+        scenarios["nodes_%d" % nodes] = result
+        print("%3d nodes %12.1f ops/s  efficiency %.2f" %
+              (nodes, result["opsPerSec"], result["scalingEfficiency"]))
+
+    output = args.output or default_output("cluster")
+    write_results(output, "cluster", dict(vars(args), problems=problems),
+                  scenarios)
+    print("Results saved to %s" % output)
+    if problems:
+        raise SystemExit("Cluster check failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Compare two saved benchmark results.
+
+    python -m benchmarks.compare bench_results/api-abc123.json \\
+        bench_results/api-def456.json
+"""
+import argparse
+import json
+
+METRICS = ("reqPerSec", "opsPerSec", "p50Ms", "p95Ms", "p99Ms", "medianMs")
+
+
+def compare(before, after):
+    """Return {scenario: {metric: (before, after, change%)}} for the
+    scenarios present in both results."""
+    changes = {}
+    for name, old in before["scenarios"].items():
+        new = after["scenarios"].get(name)
+        if new is None:
+            continue
+        changes[name] = {}
+        for metric in METRICS:
+            if metric not in old or metric not in new:
+                continue
+            change = ((new[metric] - old[metric]) / old[metric] * 100
+                      if old[metric] else 0.0)
+            changes[name][metric] = (old[metric], new[metric], change)
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print("%s (%s) -> %s (%s)" % (args.before, before.get("commit"),
+                                  args.after, after.get("commit")))
+    for name, metrics in compare(before, after).items():
+        print(name)
+        for metric, (old, new, change) in metrics.items():
+            print("  %-10s %12.3f %12.3f %+8.1f%%" % (metric, old, new, change))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Timing and reporting helpers shared by the benchmarks."""
+import datetime
+import json
+import os
+import platform
+import subprocess
+import threading
+import time
+from push_notifications.utils.stats import percentile
+
+
+def summarize(latencies, elapsed, failures=0):
+    """Summarise a list of latencies (seconds) measured over elapsed."""
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "failures": failures,
+        "seconds": round(elapsed, 4),
+        "reqPerSec": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "p50Ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95Ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99Ms": round(percentile(ordered, 99) * 1000, 3),
+        "maxMs": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
+
+
+def measure(operation, count, concurrency=1):
+    """Call operation(i) for i in range(count) from concurrency threads.
+    operation should return True on success.
+    Returns a summary as produced by summarize."""
+    latencies = []
+    failures = [0]
+    lock = threading.Lock()
+    next_index = iter(range(count))
+
+    def worker():
+        own = []
+        own_failures = 0
+        while True:
+            with lock:
+                i = next(next_index, None)
+            if i is None:
+                break
+            start = time.perf_counter()
+            ok = operation(i)
+            own.append(time.perf_counter() - start)
+            if not ok:
+                own_failures += 1
+        with lock:
+            latencies.extend(own)
+            failures[0] += own_failures
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, time.perf_counter() - start, failures[0])
+
+
+def git_commit():
+    """The current commit of the working tree, or None."""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, name, config, scenarios):
+    """Save benchmark results as JSON so runs can be compared."""
+    results = {
+        "benchmark": name,
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "config": config,
+        "scenarios": scenarios,
+    }
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    return results
+
+
+def default_output(name):
+    """Default results path, keyed by benchmark and commit."""
+    return os.path.join("bench_results", "%s-%s.json" %
+                        (name, git_commit() or "unknown"))
+
+
+def print_table(scenarios):
+    print("%-24s %10s %10s %10s %10s %9s" %
+          ("scenario", "req/s", "p50 ms", "p95 ms", "p99 ms", "failures"))
+    for name, summary in scenarios.items():
+        print("%-24s %10.1f %10.3f %10.3f %10.3f %9d" %
+              (name, summary["reqPerSec"], summary["p50Ms"],
+               summary["p95Ms"], summary["p99Ms"], summary["failures"]))
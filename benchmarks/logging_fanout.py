@@ -0,0 +1,113 @@
+"""Group fan-out throughput with different logging set-ups.
+
+Each mode runs the same group fan-outs against a local Pushbullet stub (or,
+with --no-stub, a no-op client so that logging dominates), with the
+service's logs going to a temporary file:
+
+* off: logging disabled
+* sync: a plain StreamHandler writing each record as it is logged
+* async: the batching JSON pipeline from push_notifications.utils.log
+* async_sampled: as async, keeping one in --sample-every delivery messages
+
+    python -m benchmarks.logging_fanout --group-size 1000
+"""
+import argparse
+import json
+import logging
+import tempfile
+from falcon import testing
+from push_notifications import server
+from push_notifications.pushbullet_api import PushbulletAPI
+from push_notifications.scheduler import DeliveryScheduler
+from push_notifications.storage.in_memory_storage import InMemoryStorage
+from push_notifications.utils.log import configure_logging
+from benchmarks.harness import measure, write_results, default_output
+from benchmarks.pushbullet_stub import PushbulletStub
+
+MODES = ("off", "sync", "async", "async_sampled")
+
+
+class NullPushbullet:
+    """A Pushbullet client which does nothing."""
+    def create_push(self, access_token, title, body):
+        pass
+
+
+def setup_logging(mode, sink, sample_every):
+    """Configure the service's logger for mode. Returns the handler."""
+    logger = logging.getLogger("notifications_api")
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    logging.getLogger("notifications_api.deliveries").filters = []
+    logger.propagate = False
+    if mode == "off":
+        logger.setLevel(logging.WARNING)
+        return None
+    if mode == "sync":
+        handler = logging.StreamHandler(sink)
+        handler.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)s %(name)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        return handler
+    return configure_logging(
+        sink=sink, sample_every=sample_every if mode == "async_sampled" else 1)
+
+
+def run_mode(mode, pushbullet, args):
+    storage = InMemoryStorage()
+    scheduler = DeliveryScheduler(workers=args.workers)
+    app = server.setup_api(storage, pushbullet, scheduler)
+    users = ["user%d" % i for i in range(args.group_size)]
+    for user in users:
+        storage.register_user(user, "token")
+    storage.register_group("group", users)
+
+    with tempfile.TemporaryFile("w+") as sink:
+        handler = setup_logging(mode, sink, args.sample_every)
+
+        def fanout(i):
+            result = testing.simulate_post(
+                app, "/v1/groups/group/notifications",
+                body=json.dumps({"title": "title", "body": "body"}))
+            return result.status_code == 201
+
+        summary = measure(fanout, args.fanouts, 1)
+        if handler is not None:
+            handler.flush()
+        summary["pushesPerSec"] = round(
+            summary["reqPerSec"] * args.group_size, 2)
+        setup_logging("off", None, 1)
+    scheduler.shutdown()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--group-size", type=int, default=1000)
+    parser.add_argument("--fanouts", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--sample-every", type=int, default=100)
+    parser.add_argument("--no-stub", action="store_true",
+                        help="use a no-op Pushbullet client")
+    parser.add_argument("--output", help="where to save the JSON results")
+    args = parser.parse_args()
+
+    scenarios = {}
+    with PushbulletStub() as stub:
+        pushbullet = NullPushbullet() if args.no_stub \
+            else PushbulletAPI(stub.url)
+        for mode in MODES:
+            scenarios[mode] = run_mode(mode, pushbullet, args)
+            print("%-14s %10.1f pushes/s  p50 %9.3f ms" %
+                  (mode, scenarios[mode]["pushesPerSec"],
+                   scenarios[mode]["p50Ms"]))
+
+    output = args.output or default_output("logging")
+    write_results(output, "logging", vars(args), scenarios)
+    print("Results saved to %s" % output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""A local stand-in for the Pushbullet API used by the benchmarks.
+
+The stub accepts pushes for any access token, lists the same two devices
+for every token, and can be configured to add latency and to fail a
+proportion of requests with 401, 429 or 5xx errors.
+Run it on its own with ``python -m benchmarks.pushbullet_stub``.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubConfig:
+    """Behaviour of the stub server. Rates are between 0 and 1."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, rate_401=0.0,
+                 rate_429=0.0, rate_5xx=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_401 = rate_401
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    def delay(self):
+        """Seconds to wait before responding."""
+        jitter = 0.0
+        if self.jitter_ms:
+            with self._random_lock:
+                jitter = self._random.uniform(0, self.jitter_ms)
+        return (self.latency_ms + jitter) / 1000.0
+
+    def pick_error(self):
+        """Return an (status, message) error to inject, or None."""
+        with self._random_lock:
+            roll = self._random.random()
+        for status, rate, message in (
+                (401, self.rate_401, "Access token is missing or invalid."),
+                (429, self.rate_429, "Too many requests."),
+                (503, self.rate_5xx, "Service unavailable.")):
+            if roll < rate:
+                return status, message
+            roll -= rate
+        return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this, responses on
+    # kept-alive connections wait for the client's delayed ACK.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, response_data):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        config = self.server.config
+        stats = self.server.stats
+        delay = config.delay()
+        if delay:
+            time.sleep(delay)
+        error = config.pick_error()
+        if not self.headers.get("Access-Token"):
+            error = (401, "Access token is missing or invalid.")
+        with self.server.stats_lock:
+            stats["requests"] += 1
+            if error:
+                stats[str(error[0])] = stats.get(str(error[0]), 0) + 1
+        if error:
+            status, message = error
+            self._reply(status, {"error": {"code": "stub_error",
+                                           "type": "invalid_request",
+                                           "message": message}})
+        else:
+            self._reply(200, response_data)
+
+    def do_POST(self):
+        if self.path.endswith("/pushes"):
+            self._handle({"active": True, "type": "note",
+                          "iden": "stub%d" % time.monotonic_ns()})
+        else:
+            self._reply(404, {"error": {"message": "Not found"}})
+
+    def do_GET(self):
+        if self.path.split("?")[0].endswith("/devices"):
+            self._handle({"devices": [
+                {"iden": "stubdevice%d" % i, "nickname": "Stub %d" % i,
+                 "active": True, "pushable": True} for i in (1, 2)]})
+        else:
+            self._reply(404, {"error": {"message": "Not found"}})
+
+
+class _Server(ThreadingHTTPServer):
+    # The default backlog of 5 drops connections under the benchmarks'
+    # concurrency, adding retransmission delays of a second or more.
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class PushbulletStub:
+    """A threaded HTTP server imitating Pushbullet on localhost.
+    Use ``url`` as the api_url of a PushbulletAPI."""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self._server = _Server((host, port), _Handler)
+        self._server.config = config or StubConfig()
+        self._server.stats = {"requests": 0}
+        self._server.stats_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return "http://%s:%d/v2" % (host, port)
+
+    @property
+    def config(self):
+        return self._server.config
+
+    def stats(self):
+        """Counts of requests and injected errors by status."""
+        with self._server.stats_lock:
+            return dict(self._server.stats)
+
+    def serve_forever(self):
+        """Serve requests in this thread until stopped or interrupted."""
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._server.server_close()
+
+    def start(self):
+        """Serve requests on a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="pushbullet-stub")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def add_stub_arguments(parser):
+    """Add the options controlling the stub to an argument parser."""
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--rate-401", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-5xx", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_arguments(args):
+    return StubConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                      rate_401=args.rate_401, rate_429=args.rate_429,
+                      rate_5xx=args.rate_5xx, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8089)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    stub = PushbulletStub(config_from_arguments(args), port=args.port)
+    print("Pushbullet stub listening on %s" % stub.url)
+    stub.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Worker start-up time.
+
+Each run starts a fresh interpreter and measures how long it takes to
+import push_notifications.server, to build the app, and to serve the first
+request (which includes the first Pushbullet call, made to a local stub).
+
+    python -m benchmarks.startup --runs 20
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from benchmarks.harness import write_results, default_output
+from benchmarks.pushbullet_stub import PushbulletStub
+
+CHILD = """
+import json, time
+start = time.perf_counter()
+import push_notifications.server as server
+imported = time.perf_counter()
+app = server.create_app()
+built = time.perf_counter()
+from falcon import testing
+requested = time.perf_counter()
+testing.simulate_post(app, "/v1/users", body=json.dumps(
+    {"username": "user1", "accessToken": "token1"}))
+result = testing.simulate_post(app, "/v1/users/user1/notifications",
+                               body=json.dumps({"title": "t", "body": "b"}))
+assert result.status_code == 201, result.status
+done = time.perf_counter()
+print(json.dumps({"importMs": (imported - start) * 1000,
+                  "buildMs": (built - imported) * 1000,
+                  "firstRequestMs": (done - requested) * 1000}))
+"""
+
+
+def run_once(stub_url):
+    env = dict(os.environ, PUSHBULLET_API_URL=stub_url)
+    output = subprocess.check_output([sys.executable, "-c", CHILD], env=env)
+    return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--output", help="where to save the JSON results")
+    args = parser.parse_args()
+
+    with PushbulletStub() as stub:
+        runs = [run_once(stub.url) for _ in range(args.runs)]
+
+    scenarios = {}
+    for metric in ("importMs", "buildMs", "firstRequestMs"):
+        values = [run[metric] for run in runs]
+        scenarios[metric] = {
+            "medianMs": round(statistics.median(values), 3),
+            "minMs": round(min(values), 3),
+            "maxMs": round(max(values), 3),
+        }
+        print("%-16s median %8.3f ms  min %8.3f ms  max %8.3f ms" %
+              (metric, scenarios[metric]["medianMs"],
+               scenarios[metric]["minMs"], scenarios[metric]["maxMs"]))
+
+    output = args.output or default_output("startup")
+    write_results(output, "startup", vars(args), scenarios)
+    print("Results saved to %s" % output)
+
+
+if __name__ == "__main__":
+    main()
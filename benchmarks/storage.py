@@ -0,0 +1,94 @@
+"""Multi-threaded stress and throughput benchmark for InMemoryStorage.
+
+Each thread runs a mix of lookups, counter increments, listings and
+registrations. Afterwards the counters are checked against the number of
+increments made, so lost updates show up as a failure.
+
+    python -m benchmarks.storage --threads 8 16 32 64
+"""
+import argparse
+import random
+import threading
+import time
+from push_notifications.storage.in_memory_storage import InMemoryStorage
+from benchmarks.harness import write_results, default_output
+
+
+def run(threads, operations, users, mix, stripes):
+    """Run the workload, returning a summary of throughput."""
+    storage = InMemoryStorage(stripes=stripes)
+    for i in range(users):
+        storage.register_user("user%d" % i, "token%d" % i)
+    increments = [0] * threads
+    start_barrier = threading.Barrier(threads + 1)
+
+    def worker(index):
+        rng = random.Random(index)
+        start_barrier.wait()
+        for i in range(operations):
+            roll = rng.random()
+            username = "user%d" % rng.randrange(users)
+            if roll < mix["increment"]:
+                storage.increment_notifications_pushed(username)
+                increments[index] += 1
+            elif roll < mix["increment"] + mix["list"]:
+                for user in storage.get_users():
+                    pass
+            elif roll < mix["increment"] + mix["list"] + mix["register"]:
+                storage.register_user("new%d-%d" % (index, i), "token")
+            else:
+                storage.get_by_username(username)
+
+    workers = [threading.Thread(target=worker, args=(i,))
+               for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    counted = sum(u["numOfNotificationsPushed"] for u in storage.get_users())
+    return {
+        "threads": threads,
+        "operations": threads * operations,
+        "seconds": round(elapsed, 4),
+        "opsPerSec": round(threads * operations / elapsed, 2),
+        "lostIncrements": sum(increments) - counted,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, nargs="+",
+                        default=[8, 16, 32, 64])
+    parser.add_argument("--operations", type=int, default=20000,
+                        help="operations per thread")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--stripes", type=int, default=64)
+    parser.add_argument("--increment", type=float, default=0.4)
+    parser.add_argument("--list", type=float, default=0.001)
+    parser.add_argument("--register", type=float, default=0.01)
+    parser.add_argument("--output", help="where to save the JSON results")
+    args = parser.parse_args()
+    mix = {"increment": args.increment, "list": args.list,
+           "register": args.register}
+
+    scenarios = {}
+    print("%8s %12s %10s" % ("threads", "ops/s", "lost"))
+    for threads in args.threads:
+        result = run(threads, args.operations, args.users, mix, args.stripes)
+        scenarios["threads_%d" % threads] = result
+        print("%8d %12.1f %10d" % (threads, result["opsPerSec"],
+                                   result["lostIncrements"]))
+
+    output = args.output or default_output("storage")
+    write_results(output, "storage", vars(args), scenarios)
+    print("Results saved to %s" % output)
+    if any(r["lostIncrements"] for r in scenarios.values()):
+        raise SystemExit("Increments were lost")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""gunicorn settings for running the service with a preloaded app.
+
+    gunicorn -c gunicorn.conf.py push_notifications.wsgi:api
+
+The app is imported and built once in the master, and workers are forked
+from it sharing that memory copy-on-write. This makes worker boot fast,
+since each worker skips importing Falcon and the resources.
+
+Without STORAGE_NODES each worker would have its own in-memory storage,
+so a single worker is run, serving requests on several threads. With
+STORAGE_NODES the storage is shared and WEB_CONCURRENCY workers can run.
+"""
+import gc
+import os
+
+bind = os.environ.get("BIND", "127.0.0.1:8000")
+shared_storage = bool(os.environ.get("STORAGE_NODES"))
+workers = int(os.environ.get("WEB_CONCURRENCY", 2 if shared_storage else 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+preload_app = True
+
+
+def on_starting(server):
+    if server.cfg.workers > 1 and not shared_storage:
+        raise RuntimeError(
+            "Running %d workers needs shared storage: each worker would "
+            "have its own users. Set STORAGE_NODES or use one worker."
+            % server.cfg.workers)
+
+
+def pre_fork(server, worker):
+    # Move everything allocated while preloading into the permanent
+    # generation, so the workers' garbage collector never writes to those
+    # pages and they stay shared with the master.
+    gc.freeze()
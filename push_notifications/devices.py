@@ -0,0 +1,151 @@
+"""Cached registry of each user's Pushbullet devices."""
+import collections
+import os
+import threading
+import time
+from push_notifications.scheduler import BULK
+
+# Fraction of the TTL after which a cached entry is refreshed in the
+# background while still being served.
+REFRESH_AHEAD = 0.8
+
+# Least time in seconds between fetches made because a device was not in
+# a user's cached entry.
+MISS_REFETCH_INTERVAL = 10
+
+
+class DeviceNotFoundException(Exception):
+    """The device is not one of the user's active, pushable devices."""
+    pass
+
+
+class _Entry:
+    __slots__ = ("devices", "fetched", "refreshing")
+
+    def __init__(self, devices, fetched):
+        self.devices = devices
+        self.fetched = fetched
+        self.refreshing = False
+
+
+class _Flight:
+    """A fetch of one user's devices and the threads waiting on it."""
+    __slots__ = ("lock", "waiters")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiters = 0
+
+
+class DeviceRegistry:
+    """Knows which devices each user can be pushed to.
+
+    Devices are fetched from the Pushbullet devices API the first time they
+    are needed and cached for ttl seconds. Once an entry is older than
+    REFRESH_AHEAD of the ttl it is still served, and a refresh is queued on
+    the scheduler's bulk lane, so sends almost never wait for a lookup.
+
+    At most max_entries users are cached, the least recently used being
+    evicted first. Threads missing the cache for the same user wait for a
+    single fetch rather than each calling Pushbullet.
+    """
+
+    def __init__(self, pushbullet_api, scheduler, ttl=None, max_entries=None):
+        if ttl is None:
+            ttl = float(os.environ.get("DEVICE_CACHE_TTL", 300))
+        if max_entries is None:
+            max_entries = int(os.environ.get("DEVICE_CACHE_SIZE", 10000))
+        self._pushbullet_api = pushbullet_api
+        self._scheduler = scheduler
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def get_devices(self, username, access_token):
+        """Return the user's active, pushable devices keyed by iden."""
+        entry = self._entries.get(username)
+        now = time.monotonic()
+        if entry is None or now - entry.fetched >= self._ttl:
+            return self._fetch_once(username, access_token, entry).devices
+        try:
+            self._entries.move_to_end(username)
+        except KeyError:
+            # Evicted by another thread since it was looked up.
+            pass
+        if now - entry.fetched >= self._ttl * REFRESH_AHEAD:
+            with self._lock:
+                start_refresh = not entry.refreshing
+                entry.refreshing = True
+            if start_refresh:
+                self._scheduler.submit(BULK, "devices", self._refresh,
+                                       username, access_token)
+        return entry.devices
+
+    def get_device(self, username, access_token, device_iden):
+        """Return one of the user's devices.
+        A device missing from the cache may have been added since the
+        user's devices were fetched, so they are fetched again unless that
+        was done in the last MISS_REFETCH_INTERVAL seconds.
+        If it is unknown, inactive or not pushable this will raise
+        DeviceNotFoundException."""
+        device = self.get_devices(username, access_token).get(device_iden)
+        if device is None:
+            entry = self._entries.get(username)
+            if (entry is None or
+                    time.monotonic() - entry.fetched >=
+                    MISS_REFETCH_INTERVAL):
+                device = self._fetch_once(
+                    username, access_token, entry).devices.get(device_iden)
+        if device is None:
+            raise DeviceNotFoundException(
+                "%s has no active device %s" % (username, device_iden))
+        return device
+
+    def invalidate(self, username):
+        """Forget the cached devices of a user."""
+        self._entries.pop(username, None)
+
+    def _fetch_once(self, username, access_token, seen):
+        """Fetch the user's devices to replace the entry seen, which is
+        None if there was none. If another thread is already fetching
+        them, wait for it and return its entry instead."""
+        with self._lock:
+            flight = self._flights.get(username)
+            if flight is None:
+                flight = self._flights[username] = _Flight()
+            flight.waiters += 1
+        try:
+            with flight.lock:
+                entry = self._entries.get(username)
+                if entry is not None and entry is not seen:
+                    return entry
+                return self._fetch(username, access_token)
+        finally:
+            with self._lock:
+                flight.waiters -= 1
+                if not flight.waiters:
+                    del self._flights[username]
+
+    def _fetch(self, username, access_token):
+        devices = self._pushbullet_api.list_devices(access_token)
+        entry = _Entry({device["iden"]: device for device in devices
+                        if device.get("active", True) and
+                        device.get("pushable", True)},
+                       time.monotonic())
+        with self._lock:
+            self._entries[username] = entry
+            self._entries.move_to_end(username)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def _refresh(self, username, access_token):
+        try:
+            self._fetch(username, access_token)
+        except Exception:
+            # Keep serving the old entry; it is fetched again once expired.
+            entry = self._entries.get(username)
+            if entry is not None:
+                entry.refreshing = False
@@ -0,0 +1,124 @@
+"""Recent notification history for each user."""
+import collections
+import json
+import os
+import queue
+import threading
+import time
+import weakref
+
+OK = "ok"
+ERROR = "error"
+
+_FIELDS = ("timestamp", "title", "status", "latencyMs", "error")
+
+
+# Histories to reset in forked children, see NotificationHistory._after_fork.
+_histories = weakref.WeakSet()
+
+
+def _reset_histories_after_fork():
+    for history in list(_histories):
+        history._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_histories_after_fork)
+
+
+class NotificationHistory:
+    """Keeps the last `size` notifications pushed to each user.
+
+    Each user has a ring buffer (a deque with a maxlen) of plain tuples, so
+    recording a push is a dict lookup and an append, which is atomic and
+    takes no lock. If spill_path is given every entry is also queued for a
+    background thread which appends it to that file as a line of JSON,
+    keeping the full history on disk. Entries are dropped from the spill
+    rather than blocking a push if the writer falls behind.
+    """
+
+    def __init__(self, size=None, spill_path=None, max_queue=100000):
+        if size is None:
+            size = int(os.environ.get("HISTORY_SIZE", 100))
+        if spill_path is None:
+            spill_path = os.environ.get("HISTORY_SPILL_PATH") or None
+        self._size = size
+        self._rings = {}
+        self._spill_path = spill_path
+        self._max_queue = max_queue
+        self._queue = queue.Queue(max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.dropped = 0
+        _histories.add(self)
+
+    def record(self, username, title, status, latency, error=None):
+        """Record a push of title to username which took latency seconds."""
+        entry = (time.time(), title, status, round(latency * 1000, 3), error)
+        ring = self._rings.get(username)
+        if ring is None:
+            ring = self._rings.setdefault(
+                username, collections.deque(maxlen=self._size))
+        ring.append(entry)
+        if self._spill_path:
+            if self._thread is None:
+                self._start()
+            try:
+                self._queue.put_nowait((username, entry))
+            except queue.Full:
+                self.dropped += 1
+
+    def get(self, username, offset=0, limit=None):
+        """Return the number of entries held for username and a page of
+        them, most recent first."""
+        # Copying a deque runs without releasing the GIL, so concurrent
+        # appends cannot interrupt it.
+        entries = tuple(self._rings.get(username, ()))
+        total = len(entries)
+        end = total - offset
+        start = 0 if limit is None else max(0, end - limit)
+        return total, [dict(zip(_FIELDS, entry))
+                       for entry in reversed(entries[start:max(0, end)])]
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._write,
+                                          name="history-writer")
+                thread.daemon = True
+                thread.start()
+                self._thread = thread
+
+    def _after_fork(self):
+        """The writer thread does not survive fork; entries queued in the
+        parent were written (or will be) by the parent."""
+        self._queue = queue.Queue(self._max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _write(self):
+        entries = self._queue
+        while True:
+            batch = [entries.get()]
+            while True:
+                try:
+                    batch.append(entries.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            for username, entry in batch:
+                data = dict(zip(_FIELDS, entry))
+                data["username"] = username
+                lines.append(json.dumps(data))
+            try:
+                with open(self._spill_path, "a") as spill:
+                    spill.write("\n".join(lines) + "\n")
+            except OSError:
+                self.dropped += len(batch)
+            for _ in batch:
+                entries.task_done()
+
+    def flush(self):
+        """Wait until every queued entry has been spilled."""
+        if self._thread is not None:
+            self._queue.join()
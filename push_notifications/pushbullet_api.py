@@ -1,6 +1,7 @@
 """API for Pushbullet service."""
-import requests
 import json
+import os
+import threading
 
 
 class InvalidAccessTokenException(Exception):
@@ -15,22 +16,63 @@ class PushbulletException(Exception):
 
 
 class PushbulletAPI:
-    """An interface to the PushBullet service."""
-    def __init__(self, api_url):
+    """An interface to the PushBullet service.
+    Requests time out after timeout seconds (PUSHBULLET_TIMEOUT, default 10)
+    so a hung connection cannot hold a delivery worker forever. Each thread
+    keeps its own HTTP session so connections are reused."""
+    def __init__(self, api_url, timeout=None):
+        if timeout is None:
+            timeout = float(os.environ.get("PUSHBULLET_TIMEOUT", 10))
         self._api_url = api_url
+        self._timeout = timeout
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            # requests is slow to import, so it is only loaded once the
+            # first request is made rather than at worker start up.
+            import requests
+            session = self._local.session = requests.Session()
+        return session
 
     def _post(self, access_token, path, data):
         """Perform a POST request to the API.
         The path should follow the api_url passed to the constructor.
         """
-        json_data = json.dumps(data)
-        response = requests.post(
-            "%s%s" % (self._api_url, path), json_data, headers={
-                "Access-Token": access_token,
-                "Content-Type": "application/json"
-            }
-        )
+        import requests
+        # Sent as bytes so http.client writes the headers and body in one
+        # packet; separate writes on a kept-alive connection are delayed by
+        # Nagle's algorithm.
+        json_data = json.dumps(data).encode("utf-8")
+        try:
+            response = self._session().post(
+                "%s%s" % (self._api_url, path), json_data, headers={
+                    "Access-Token": access_token,
+                    "Content-Type": "application/json"
+                }, timeout=self._timeout
+            )
+        except requests.RequestException as e:
+            raise PushbulletException("Request failed: %s" % e)
+        return self._check_response(response)
 
+    def _get(self, access_token, path, params=None):
+        """Perform a GET request to the API.
+        The path should follow the api_url passed to the constructor.
+        """
+        import requests
+        try:
+            response = self._session().get(
+                "%s%s" % (self._api_url, path), params=params, headers={
+                    "Access-Token": access_token
+                }, timeout=self._timeout
+            )
+        except requests.RequestException as e:
+            raise PushbulletException("Request failed: %s" % e)
+        return self._check_response(response)
+
+    def _check_response(self, response):
+        """Raise the appropriate exception if the request failed."""
         if response.status_code == 401:
             # Invalid token. There will be a specific message in the JSON
             error_message = response.json()["error"]["message"]
@@ -43,10 +85,26 @@ class PushbulletAPI:
 
         return response
 
-    def create_push(self, access_token, title, body):
-        """Create a new push."""
-        self._post(access_token, "/pushes", {
+    def create_push(self, access_token, title, body, device_iden=None):
+        """Create a new push.
+        If device_iden is given the push is only sent to that device,
+        otherwise it goes to all of the token's devices."""
+        data = {
             "title": title,
             "body": body,
             "type": "note"
-        })
+        }
+        if device_iden:
+            data["device_iden"] = device_iden
+        self._post(access_token, "/pushes", data)
+
+    def list_devices(self, access_token):
+        """List the active devices of a token."""
+        devices = []
+        params = {"active": "true"}
+        while True:
+            data = self._get(access_token, "/devices", params).json()
+            devices.extend(data.get("devices", []))
+            if not data.get("cursor"):
+                return devices
+            params = {"active": "true", "cursor": data["cursor"]}
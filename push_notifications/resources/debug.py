@@ -0,0 +1,22 @@
+"""Resources for debugging the running service."""
+
+import logging
+from push_notifications.utils.json import json_dump
+
+
+class TracesResource:
+    """Resource exposing the traces kept by the request tracer."""
+
+    def __init__(self, tracer):
+        self._tracer = tracer
+        self._logger = logging.getLogger('notifications_api.debug')
+
+    def on_get(self, req, resp):
+        """List kept traces, most recent first."""
+        self._logger.info("Listing traces")
+        resp.body = json_dump(self._tracer.traces())
+
+    def on_delete(self, req, resp):
+        """Discard all kept traces."""
+        self._logger.info("Clearing traces")
+        self._tracer.clear()
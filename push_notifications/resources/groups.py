@@ -1,6 +1,7 @@
 """Resources relating to groups."""
 
 import logging
+import time
 import falcon
 from push_notifications.utils.falcon import decode_json_request
 from push_notifications.utils.json import json_dump
@@ -8,6 +9,12 @@ from push_notifications.storage import DuplicateGroupException, \
     UserNotFoundException, GroupNotFoundException
 from push_notifications.pushbullet_api import InvalidAccessTokenException, \
     PushbulletException
+from push_notifications.scheduler import BULK
+from push_notifications.devices import DeviceNotFoundException
+from push_notifications.history import OK, ERROR
+from push_notifications.utils.log import DELIVERY_LOGGER
+
+_delivery_logger = logging.getLogger(DELIVERY_LOGGER)
 
 
 def get_group(storage, group_id, logger):
@@ -20,25 +27,101 @@ def get_group(storage, group_id, logger):
 
 
 def send_notification_to_user(pushbullet_api, storage, logger,
-                              user, title, body):
+                              user, title, body,
+                              devices=None, device_iden=None, history=None,
+                              access_token=None):
     """Send a notification to a user.
+    If device_iden is given only that device is notified, provided the
+    device registry knows it as active. The attempt is recorded in history
+    if one is given and the user exists. If the user's access_token is
+    given the user is not looked up again.
     Returns if True, None if there is no error.
     otherwise False, followed by the error."""
+    if access_token is None:
+        try:
+            access_token = storage.get_by_username(user)["accessToken"]
+        except UserNotFoundException:
+            # Not recorded, so unknown usernames cannot grow the history.
+            logger.error("User not found %s", user)
+            return False, "%s: User not found" % user
+    started = time.perf_counter()
+    error = _push_to_user(pushbullet_api, storage, logger, user,
+                          access_token, title, body, devices, device_iden)
+    if history is not None:
+        history.record(user, title, ERROR if error else OK,
+                       time.perf_counter() - started, error)
+    if error:
+        return False, error
+    return True, None
+
+
+def _push_to_user(pushbullet_api, storage, logger, user, access_token,
+                  title, body, devices, device_iden):
+    """Returns None, or the error."""
     try:
-        access_token = storage.get_by_username(user)
-        pushbullet_api.create_push(access_token, title, body)
+        if device_iden:
+            devices.get_device(user, access_token, device_iden)
+            pushbullet_api.create_push(access_token, title, body,
+                                       device_iden)
+        else:
+            pushbullet_api.create_push(access_token, title, body)
         storage.increment_notifications_pushed(user)
-        logger.info("Notification pushed to %s" % user)
-        return True, None
+        _delivery_logger.info("Notification pushed to %s", user,
+                              extra={"username": user})
+        return None
     except UserNotFoundException:
-        logger.error("User not found %s" % user)
-        return False, "%s: User not found" % user
+        # The user was removed or moved since being looked up.
+        logger.error("User not found %s", user)
+        return "%s: User not found" % user
+    except DeviceNotFoundException:
+        logger.info("Device %s not found for %s", device_iden, user)
+        return "%s: Device not found" % user
     except InvalidAccessTokenException:
-        logger.error("Invalid pushbullet access token %s" % access_token)
-        return False, "%s: Incorrect access token" % user
+        logger.error("Invalid pushbullet access token %s", access_token)
+        return "%s: Incorrect access token" % user
     except PushbulletException as e:
-        logger.error("Pushbullet error %s" % str(e))
-        return False, "%s: Pushbullet error" % user
+        logger.error("Pushbullet error %s", e)
+        return "%s: Pushbullet error" % user
+
+
+def send_notification_to_users(scheduler, pushbullet_api, storage, logger,
+                               flow, users, title, body, history=None):
+    """Fan a notification out to several users on the bulk lane.
+    The users are looked up together; with sharded storage this is one
+    job per node, run in parallel. Each user found is then queued as a
+    separate job so that urgent deliveries can be scheduled in between.
+    Every job uses the given flow, so the send gets one share of the lane
+    (and its weight) however its users are spread across nodes.
+    Returns a list of errors."""
+    if hasattr(storage, "partition"):
+        lookups = [scheduler.submit(BULK, flow, storage.get_by_usernames,
+                                    shard_users)
+                   for shard_users in storage.partition(users).values()]
+        found = {}
+        for lookup in lookups:
+            found.update(lookup.result())
+    else:
+        found = storage.get_by_usernames(users)
+
+    results = []
+    for user in users:
+        if user not in found:
+            logger.error("User not found %s", user)
+            results.append("%s: User not found" % user)
+            continue
+        results.append(scheduler.submit(
+            BULK, flow, send_notification_to_user,
+            pushbullet_api, storage, logger, user, title, body,
+            None, None, history, found[user]["accessToken"]))
+    errors = []
+    for result in results:
+        if isinstance(result, str):
+            errors.append(result)
+            continue
+        success, error = result.result()
+        if not success:
+            errors.append(error)
+    return errors
 
 
 class GroupsResource:
@@ -61,11 +144,11 @@ class GroupsResource:
             self._storage.register_group(data["groupId"], data["users"])
         except DuplicateGroupException:
             self._logger.info(
-                "Refused duplicate registration for %s" % data["groupId"])
+                "Refused duplicate registration for %s", data["groupId"])
             raise falcon.HTTPBadRequest()
         except UserNotFoundException as e:
             self._logger.info(
-                "User not found %s" % e)
+                "User not found %s", e)
             raise falcon.HTTPBadRequest()
         resp.body = json_dump(self._storage.get_group(data["groupId"]))
         resp.status = falcon.HTTP_201
@@ -81,7 +164,7 @@ class GroupResource:
 
     def on_get(self, req, resp, group_id):
         """Handles GET requests"""
-        self._logger.info("Getting group info about %s" % group_id)
+        self._logger.info("Getting group info about %s", group_id)
         group = get_group(self._storage, group_id, self._logger)
         resp.body = json_dump(group)
 
@@ -89,27 +172,27 @@ class GroupResource:
 class GroupNotificationsResource:
     """Resource representing a notification on a group."""
 
-    def __init__(self, storage, pushbullet_api):
+    def __init__(self, storage, pushbullet_api, scheduler, history):
         self._storage = storage
-        self.pushbullet_api = pushbullet_api
+        self._pushbullet_api = pushbullet_api
+        self._scheduler = scheduler
+        self._history = history
         self._logger = logging.getLogger('notifications_api.groups')
 
     def on_post(self, req, resp, group_id):
         """Create a notification for this group."""
-        self._logger.info("Posting new notification to %s" % group_id)
+        self._logger.info("Posting new notification to %s", group_id)
         data = decode_json_request(req, ["title", "body"])
         user_ids = get_group(self._storage, group_id, self._logger)
 
-        errors = []
-        for user in user_ids:
-            success, error = send_notification_to_user(self._pushbullet_api,
-                                                       self._storage,
-                                                       self._logger,
-                                                       user,
-                                                       data["title"],
-                                                       data["body"])
-            if not success:
-                errors.append(error)
-
-            resp.status = falcon.HTTP_201
-            resp.body = json_dump({"errors": errors})
+        errors = send_notification_to_users(self._scheduler,
+                                            self._pushbullet_api,
+                                            self._storage,
+                                            self._logger,
+                                            "group:%s" % group_id,
+                                            user_ids,
+                                            data["title"],
+                                            data["body"],
+                                            self._history)
+        resp.status = falcon.HTTP_201
+        resp.body = json_dump({"errors": errors})
@@ -1,12 +1,20 @@
 """Resources relating to notifications."""
 
+import collections
+import itertools
 import logging
 import falcon
-from push_notifications.utils.falcon import decode_json_request
+from push_notifications.utils.falcon import decode_json_request, \
+    iter_ndjson_request, InvalidRecord
 from push_notifications.utils.json import json_dump
 from push_notifications.storage import DuplicateGroupException, \
     UserNotFoundException, GroupNotFoundException
-from push_notifications.resources.groups import send_notification_to_user
+from push_notifications.resources.groups import send_notification_to_user, \
+    send_notification_to_users
+from push_notifications.scheduler import BULK
+
+# Deliveries a single stream may have queued before it stops reading.
+DEFAULT_MAX_IN_FLIGHT = 64
 
 
 def get_group(storage, group_id, logger):
@@ -18,38 +26,136 @@ def get_group(storage, group_id, logger):
     return user_ids
 
 
+def _is_group_id_list(group_ids):
+    """Group ids are strings or integers, as accepted by /v1/groups."""
+    return isinstance(group_ids, list) and all(
+        isinstance(group_id, (str, int)) and not isinstance(group_id, bool)
+        for group_id in group_ids)
+
+
 class NotificationsResource:
     """Resource representing notifications."""
 
-    def __init__(self, storage, pushbullet_api):
+    def __init__(self, storage, pushbullet_api, scheduler, history):
         self._storage = storage
         self._pushbullet_api = pushbullet_api
+        self._scheduler = scheduler
+        self._history = history
         self._logger = logging.getLogger('notifications_api.notifications')
 
     def on_post(self, req, resp):
-        """Create a group."""
+        """Send a notification to the users of several groups."""
         self._logger.info("Sending notifications")
         data = decode_json_request(req, ["groupIds", "title", "body"])
+        if not _is_group_id_list(data["groupIds"]):
+            raise falcon.HTTPBadRequest(
+                "'groupIds' must be a list of group ids")
 
-        users = Set()
+        users = []
+        seen = set()
         errors = []
 
         for group_id in data["groupIds"]:
             try:
                 for user_to_add in self._storage.get_group(group_id):
-                    users.append(user_to_add)
+                    if user_to_add not in seen:
+                        seen.add(user_to_add)
+                        users.append(user_to_add)
             except GroupNotFoundException:
                 self._logger.info(
-                    "Group Not Found %s" % group_id)
+                    "Group Not Found %s", group_id)
                 errors.append("%s: Group Not Found" % group_id)
 
-        for user in users:
-            success, error = send_notification_to_user(self._pushbullet_api,
-                                                       self._storage,
-                                                       user,
-                                                       data["title"],
-                                                       data["body"])
+        # Group ids may be integers as well as strings.
+        flow = "groups:%s" % ",".join(map(str, data["groupIds"]))
+        errors.extend(send_notification_to_users(
+            self._scheduler, self._pushbullet_api, self._storage,
+            self._logger, flow, users, data["title"], data["body"],
+            self._history))
 
-        resp.body = json_dump(self._storage.get_group(data["groupId"]))
+        resp.body = json_dump({"errors": errors})
         resp.status = falcon.HTTP_201
-        resp.location = "/v1/groups/%s" % data["groupId"]
+
+
+class NotificationStreamResource:
+    """Resource ingesting a stream of user notifications.
+
+    The request body is newline-delimited JSON with one
+    {"username", "title", "body"} record per line, optionally with a
+    "deviceIden" to notify only that device. Records are read as
+    deliveries complete, with at most max_in_flight queued at once, so a
+    fast producer is slowed down to the rate notifications are sent.
+    One result per record is streamed back in input order, followed by a
+    summary line.
+    """
+
+    def __init__(self, storage, pushbullet_api, scheduler, devices, history,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        self._storage = storage
+        self._pushbullet_api = pushbullet_api
+        self._scheduler = scheduler
+        self._devices = devices
+        self._history = history
+        self._max_in_flight = max_in_flight
+        self._stream_ids = itertools.count(1)
+        self._logger = logging.getLogger('notifications_api.notifications')
+
+    def on_post(self, req, resp):
+        """Send a stream of notifications."""
+        stream_id = next(self._stream_ids)
+        self._logger.info("Receiving notification stream %d", stream_id)
+        resp.status = falcon.HTTP_200
+        resp.content_type = "application/x-ndjson"
+        resp.stream = self._deliver(req, "stream:%d" % stream_id)
+
+    def _deliver(self, req, flow):
+        """Generate the response body while delivering the request body.
+        Invalid records are queued with their error so results stay in
+        input order."""
+        in_flight = collections.deque()
+        counts = {"ok": 0, "error": 0}
+
+        def complete():
+            line, username, pending = in_flight.popleft()
+            if isinstance(pending, InvalidRecord):
+                error = pending.message
+            else:
+                try:
+                    success, error = pending.result()
+                except Exception:
+                    # The headers have been sent, so a failed delivery is
+                    # reported in its result line rather than ending the
+                    # response early.
+                    self._logger.exception(
+                        "Delivery to %s failed in stream %s", username, flow)
+                    error = "%s: Delivery failed" % username
+            record = {"line": line, "username": username,
+                      "status": "error" if error else "ok"}
+            if error:
+                record["error"] = error
+            counts[record["status"]] += 1
+            return (json_dump(record) + "\n").encode("utf-8")
+
+        for line, data in iter_ndjson_request(
+                req, ["username", "title", "body"]):
+            while len(in_flight) >= self._max_in_flight:
+                yield complete()
+            if not isinstance(data, InvalidRecord) and not isinstance(
+                    data.get("deviceIden") or "", str):
+                data = InvalidRecord("Expected a string for 'deviceIden'")
+            if isinstance(data, InvalidRecord):
+                in_flight.append((line, None, data))
+                continue
+            in_flight.append((line, data["username"], self._scheduler.submit(
+                BULK, flow, send_notification_to_user,
+                self._pushbullet_api, self._storage, self._logger,
+                data["username"], data["title"], data["body"],
+                self._devices, data.get("deviceIden"), self._history)))
+
+        while in_flight:
+            yield complete()
+
+        self._logger.info("Notification stream %s finished", flow)
+        yield (json_dump({"summary": {"sent": counts["ok"],
+                                      "failed": counts["error"]}}) +
+               "\n").encode("utf-8")
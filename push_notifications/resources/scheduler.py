@@ -0,0 +1,17 @@
+"""Resources relating to the delivery scheduler."""
+
+import logging
+from push_notifications.utils.json import json_dump
+
+
+class SchedulerResource:
+    """Resource reporting the state of the delivery scheduler."""
+
+    def __init__(self, scheduler):
+        self._scheduler = scheduler
+        self._logger = logging.getLogger('notifications_api.scheduler')
+
+    def on_get(self, req, resp):
+        """Return queue depth and wait times for each lane."""
+        self._logger.info("Getting scheduler statistics")
+        resp.body = json_dump(self._scheduler.stats())
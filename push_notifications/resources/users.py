@@ -1,6 +1,7 @@
 """Resources relating to users."""
 
 import logging
+import time
 import falcon
 
 from push_notifications.utils.json import json_dump
@@ -9,6 +10,13 @@ from push_notifications.storage import UserNotFoundException, \
     DuplicateUserException
 from push_notifications.pushbullet_api import InvalidAccessTokenException, \
     PushbulletException
+from push_notifications.scheduler import URGENT
+from push_notifications.devices import DeviceNotFoundException
+from push_notifications.history import OK, ERROR
+from push_notifications.utils.log import DELIVERY_LOGGER
+
+# Largest page of history returned at once.
+MAX_HISTORY_PAGE = 100
 
 
 def get_user(storage, username, logger=None):
@@ -19,7 +27,7 @@ def get_user(storage, username, logger=None):
         return storage.get_by_username(username)
     except UserNotFoundException:
         if logger:
-            logger.error("User %s not found" % username)
+            logger.error("User %s not found", username)
         raise falcon.HTTPNotFound()
 
 
@@ -34,18 +42,20 @@ class UsersResource:
         """Register a new user."""
         self._logger.info("New registration request")
         data = decode_json_request(req, ["username", "accessToken"])
-        self._logger.info("Registration request for %s" % data["username"])
+        if not isinstance(data["username"], str):
+            raise falcon.HTTPBadRequest("'username' must be a string")
+        self._logger.info("Registration request for %s", data["username"])
         try:
             user = self._storage.register_user(data["username"],
                                                data["accessToken"])
         except DuplicateUserException:
             self._logger.info(
-                "Refused duplicate registration for %s" % data["username"])
+                "Refused duplicate registration for %s", data["username"])
             raise falcon.HTTPBadRequest()
         resp.body = json_dump(user)
         resp.status = falcon.HTTP_201
         resp.location = "/v1/users/%s" % user["username"]
-        self._logger.info("Registration completed for %s" % data["username"])
+        self._logger.info("Registration completed for %s", data["username"])
 
     def on_get(self, req, resp):
         """List users."""
@@ -62,47 +72,132 @@ class UserResource:
 
     def on_get(self, req, resp, username):
         """Handles GET requests"""
-        self._logger.info("Getting user info about %s" % username)
+        self._logger.info("Getting user info about %s", username)
         user = get_user(self._storage, username, self._logger)
         resp.body = json_dump(user)
 
 
+class UserDevicesResource:
+    """Resource listing the devices notifications can target."""
+
+    def __init__(self, storage, devices):
+        self._storage = storage
+        self._devices = devices
+        self._logger = logging.getLogger('notifications_api.user_devices')
+
+    def on_get(self, req, resp, username):
+        """List the user's active devices."""
+        self._logger.info("Listing devices for %s", username)
+        user = get_user(self._storage, username, self._logger)
+        try:
+            devices = self._devices.get_devices(username, user["accessToken"])
+        except InvalidAccessTokenException:
+            self._logger.error(
+                "Invalid pushbullet access token %s", user["accessToken"])
+            raise falcon.HTTPForbidden("Incorrect access token")
+        except PushbulletException as e:
+            self._logger.error(
+                "Pushbullet error %s", e)
+            raise falcon.HTTPInternalServerError
+        resp.body = json_dump([{"iden": device["iden"],
+                                "nickname": device.get("nickname")}
+                               for device in devices.values()])
+
+
 class UserNotificationsResource:
-    def __init__(self, storage, pushbullet_api):
+    def __init__(self, storage, pushbullet_api, scheduler, devices, history):
         self._storage = storage
         self._pushbullet_api = pushbullet_api
+        self._scheduler = scheduler
+        self._devices = devices
+        self._history = history
         self._logger = logging.getLogger(
             'notifications_api.user_notifications')
+        self._delivery_logger = logging.getLogger(DELIVERY_LOGGER)
 
     def on_get(self, req, resp, username):
         """Return the number of notifications sent."""
-        self._logger.info("Listing notification count for %s" % username)
+        self._logger.info("Listing notification count for %s", username)
         user = get_user(self._storage, username, self._logger)
         resp.body = json_dump({"numOfNotificationsPushed":
                                user["numOfNotificationsPushed"]})
 
     def on_post(self, req, resp, username):
         """Post a new notification."""
-        self._logger.info("Posting new notification to %s" % username)
+        self._logger.info("Posting new notification to %s", username)
         user = get_user(self._storage, username, self._logger)
         access_token = user["accessToken"]
 
         data = decode_json_request(req, ["title", "body"])
+        if not isinstance(data.get("deviceIden", ""), str):
+            raise falcon.HTTPBadRequest("'deviceIden' must be a string")
+        args = (access_token, data["title"], data["body"])
+        started = time.perf_counter()
         try:
-            self._pushbullet_api.create_push(access_token,
-                                             data["title"], data["body"])
+            if data.get("deviceIden"):
+                # Checked against the cached registry, so inactive devices
+                # are refused without a call to Pushbullet.
+                self._devices.get_device(username, access_token,
+                                         data["deviceIden"])
+                args += (data["deviceIden"],)
+            # Single-user pushes use the urgent lane so they are not stuck
+            # behind any group broadcast that is currently draining.
+            self._scheduler.submit(URGENT, username,
+                                   self._pushbullet_api.create_push,
+                                   *args).result()
+        except DeviceNotFoundException:
+            self._logger.info(
+                "Device %s not found for %s", data["deviceIden"], username)
+            self._record(username, data["title"], started,
+                         "%s: Device not found" % username)
+            raise falcon.HTTPBadRequest("Unknown or inactive device")
         except InvalidAccessTokenException:
             self._logger.error(
-                "Invalid pushbullet access token %s" % access_token)
+                "Invalid pushbullet access token %s", access_token)
+            self._record(username, data["title"], started,
+                         "%s: Incorrect access token" % username)
             raise falcon.HTTPForbidden("Incorrect access token")
         except PushbulletException as e:
             self._logger.error(
-                "Pushbullet error %s" % str(e))
+                "Pushbullet error %s", e)
+            self._record(username, data["title"], started,
+                         "%s: Pushbullet error" % username)
             raise falcon.HTTPInternalServerError
+        self._record(username, data["title"], started)
         num_notifications = self._storage.increment_notifications_pushed(
             username)
 
-        self._logger.info("Notification pushed to %s" % username)
+        self._delivery_logger.info("Notification pushed to %s", username,
+                                   extra={"username": username})
         resp.status = falcon.HTTP_201
         resp.body = json_dump({"numOfNotificationsPushed":
                                num_notifications})
+
+    def _record(self, username, title, started, error=None):
+        self._history.record(username, title, ERROR if error else OK,
+                             time.perf_counter() - started, error)
+
+
+class UserNotificationHistoryResource:
+    """Resource listing the notifications recently sent to a user."""
+
+    def __init__(self, storage, history):
+        self._storage = storage
+        self._history = history
+        self._logger = logging.getLogger(
+            'notifications_api.user_notifications')
+
+    def on_get(self, req, resp, username):
+        """List recent notifications, most recent first.
+        Paginated with the offset and limit query parameters."""
+        self._logger.info("Listing notification history for %s", username)
+        get_user(self._storage, username, self._logger)
+        offset = req.get_param_as_int("offset", min=0) or 0
+        limit = req.get_param_as_int("limit", min=1, max=MAX_HISTORY_PAGE)
+        if limit is None:
+            limit = MAX_HISTORY_PAGE
+        total, notifications = self._history.get(username, offset, limit)
+        resp.body = json_dump({"total": total,
+                               "offset": offset,
+                               "limit": limit,
+                               "notifications": notifications})
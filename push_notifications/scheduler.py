@@ -0,0 +1,272 @@
+"""Scheduling of notification deliveries.
+
+Deliveries are queued in priority lanes. Workers always drain the urgent
+lane before the bulk lane, and within a lane they share time between
+flows (e.g. one flow per group fan-out) using weighted round robin, so a
+single large broadcast cannot starve other senders.
+"""
+import collections
+import contextvars
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from push_notifications.utils import tracing
+from push_notifications.utils.stats import percentile
+
+URGENT = "urgent"
+BULK = "bulk"
+
+# Lanes in strict priority order.
+LANES = (URGENT, BULK)
+
+# Number of recent wait times kept per lane for percentile reporting.
+WAIT_SAMPLE_SIZE = 1024
+
+
+class UnknownLaneException(Exception):
+    """The lane requested does not exist."""
+    pass
+
+
+def parse_weights(value):
+    """Parse flow weights given as "flow=weight" pairs separated by
+    semicolons, e.g. "group:alerts=4;group:news=2".
+    Returns a dict of flow to weight; raises ValueError if malformed."""
+    weights = {}
+    for pair in value.split(";"):
+        if not pair.strip():
+            continue
+        flow, sep, weight = pair.strip().rpartition("=")
+        if not sep or not flow:
+            raise ValueError("Expected flow=weight, got %r" % pair)
+        weights[flow] = int(weight)
+    return weights
+
+
+class _Job:
+    """A unit of work waiting in a lane.
+    Jobs run in a copy of the submitter's context, so request-scoped
+    state such as the current trace follows them onto the worker."""
+    __slots__ = ("fn", "args", "future", "enqueued", "context")
+
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+        self.context = contextvars.copy_context()
+
+    def run(self):
+        tracing.add_span("scheduler.queue_wait", self.enqueued,
+                         time.perf_counter())
+        return self.fn(*self.args)
+
+
+class _Lane:
+    """A queue of jobs grouped by flow, served by weighted round robin."""
+
+    def __init__(self, name):
+        self.name = name
+        self.depth = 0
+        self.submitted = 0
+        self.dispatched = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent_waits = collections.deque(maxlen=WAIT_SAMPLE_SIZE)
+        self._flows = {}
+        self._active = collections.deque()
+        self._credit = {}
+
+    def push(self, flow, job):
+        queue = self._flows.get(flow)
+        if queue is None:
+            queue = self._flows[flow] = collections.deque()
+            self._active.append(flow)
+        queue.append(job)
+        self.depth += 1
+        self.submitted += 1
+
+    def pop(self, weights):
+        """Take the next job, or None if the lane is empty."""
+        if not self._active:
+            return None
+        flow = self._active[0]
+        credit = self._credit.get(flow)
+        if credit is None:
+            credit = weights.get(flow, 1)
+        queue = self._flows[flow]
+        job = queue.popleft()
+        credit -= 1
+        if not queue:
+            # The flow has drained; forget it entirely.
+            self._active.popleft()
+            del self._flows[flow]
+            self._credit.pop(flow, None)
+        elif credit <= 0:
+            # Used its share for this round, go to the back of the line.
+            self._active.rotate(-1)
+            self._credit.pop(flow, None)
+        else:
+            self._credit[flow] = credit
+        self.depth -= 1
+        self.dispatched += 1
+        wait = time.perf_counter() - job.enqueued
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.recent_waits.append(wait)
+        return job
+
+    def stats(self):
+        waits = sorted(self.recent_waits)
+        return {
+            "depth": self.depth,
+            "flows": len(self._flows),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "meanWaitMs": _ms(self.total_wait / self.dispatched
+                              if self.dispatched else 0.0),
+            "maxWaitMs": _ms(self.max_wait),
+            "p50WaitMs": _ms(percentile(waits, 50)),
+            "p99WaitMs": _ms(percentile(waits, 99)),
+        }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+# Schedulers to reset in forked children, see DeliveryScheduler._after_fork.
+_schedulers = weakref.WeakSet()
+
+
+def _reset_schedulers_after_fork():
+    for scheduler in list(_schedulers):
+        scheduler._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_schedulers_after_fork)
+
+
+class DeliveryScheduler:
+    """Runs deliveries on a pool of worker threads.
+
+    Jobs submitted to the urgent lane are always started before any bulk
+    job. Because fan-outs are submitted one job per recipient, an urgent
+    job only ever waits for in-flight deliveries, never for the rest of a
+    broadcast that is still draining.
+
+    Workers are only started by the first submit, so a scheduler created
+    in a preloading master process (e.g. gunicorn --preload) starts its own
+    workers in each forked child.
+
+    weights maps flows to their weight; by default they are read from
+    DELIVERY_WEIGHTS (see parse_weights). Group fan-outs use the flow
+    "group:<group id>".
+    """
+
+    def __init__(self, workers=None, weights=None):
+        if workers is None:
+            workers = int(os.environ.get("DELIVERY_WORKERS", 8))
+        if weights is None:
+            weights = parse_weights(os.environ.get("DELIVERY_WEIGHTS", ""))
+        self._num_workers = workers
+        self._lanes = collections.OrderedDict(
+            (name, _Lane(name)) for name in LANES)
+        self._weights = {}
+        self._condition = threading.Condition()
+        self._threads = []
+        self._shutdown = False
+        for flow, weight in weights.items():
+            self.set_weight(flow, weight)
+        _schedulers.add(self)
+
+    def set_weight(self, flow, weight):
+        """Set how many jobs a flow may run per round within its lane."""
+        with self._condition:
+            if weight > 1:
+                self._weights[flow] = int(weight)
+            else:
+                self._weights.pop(flow, None)
+
+    def submit(self, lane, flow, fn, *args):
+        """Queue fn(*args) for delivery.
+        Returns a Future for the result of the call."""
+        if lane not in self._lanes:
+            raise UnknownLaneException("%s is not a lane" % lane)
+        job = _Job(fn, args)
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Scheduler has been shut down")
+            self._start_workers()
+            self._lanes[lane].push(flow, job)
+            self._condition.notify()
+        return job.future
+
+    def weights(self):
+        """Return the flows with a weight above 1 and their weights."""
+        with self._condition:
+            return dict(self._weights)
+
+    def stats(self):
+        """Return queue depth and wait time statistics for each lane."""
+        with self._condition:
+            return {name: lane.stats() for name, lane in self._lanes.items()}
+
+    def shutdown(self, wait=True):
+        """Stop the workers once all queued jobs have run."""
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _after_fork(self):
+        """Threads do not survive fork, so forget the parent's workers
+        and any jobs they would have run."""
+        self._condition = threading.Condition()
+        self._threads = []
+        self._lanes = collections.OrderedDict(
+            (name, _Lane(name)) for name in LANES)
+
+    def _start_workers(self):
+        """Start the worker pool on first use.
+        Must be called with the condition held."""
+        if self._threads:
+            return
+        for i in range(self._num_workers):
+            thread = threading.Thread(target=self._work,
+                                      name="delivery-%d" % i)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _next_job(self):
+        """Block until a job is available.
+        Returns None once the scheduler is shut down and drained."""
+        with self._condition:
+            while True:
+                for lane in self._lanes.values():
+                    job = lane.pop(self._weights)
+                    if job is not None:
+                        return lane, job
+                if self._shutdown:
+                    return None, None
+                self._condition.wait()
+
+    def _work(self):
+        while True:
+            lane, job = self._next_job()
+            if job is None:
+                return
+            if job.future.set_running_or_notify_cancel():
+                try:
+                    job.future.set_result(job.context.run(job.run))
+                except BaseException as e:
+                    job.future.set_exception(e)
+            with self._condition:
+                lane.completed += 1
@@ -1,40 +1,103 @@
-"""A simple Notification Server."""
+"""A simple Notification Server.
+
+Importing this module is cheap: Falcon, the resources and the HTTP client
+are only imported when an app is built, so WSGI servers can import it and
+build the app at the point that suits them. Use create_app() as an app
+factory, or push_notifications.wsgi:api for servers that need a module
+attribute.
+"""
 
 import os
-import falcon
-from .storage.in_memory_storage import InMemoryStorage
-from .pushbullet_api import PushbulletAPI
-from .resources.users import UsersResource, UserResource, \
-    UserNotificationsResource
-from .resources.groups import GroupsResource, GroupResource, \
-    GroupNotificationsResource
-from .resources.notifications import NotificationsResource
 
 
-def setup_api(storage=None, pushbullet=None):
-    """Setup a WSGI API with the given storage and pushbullet api."""
-    api = falcon.API()
+def setup_api(storage=None, pushbullet=None, scheduler=None, tracer=None,
+              devices=None, history=None):
+    """Setup a WSGI API with the given storage, pushbullet api,
+    delivery scheduler, device registry and notification history.
+    If a tracer is given (or configured in the environment) requests are
+    traced and kept traces are available from /debug/traces."""
+    import falcon
+    from .storage.in_memory_storage import InMemoryStorage
+    from .storage.sharded_storage import ShardedStorage
+    from .pushbullet_api import PushbulletAPI
+    from .scheduler import DeliveryScheduler
+    from .devices import DeviceRegistry
+    from .history import NotificationHistory
+    from .utils.tracing import Tracer, TracingMiddleware, TracedProxy
+    from .resources.users import UsersResource, UserResource, \
+        UserNotificationsResource, UserDevicesResource, \
+        UserNotificationHistoryResource
+    from .resources.groups import GroupsResource, GroupResource, \
+        GroupNotificationsResource
+    from .resources.notifications import NotificationsResource, \
+        NotificationStreamResource
+    from .resources.scheduler import SchedulerResource
+    from .resources.debug import TracesResource
+
+    if not tracer:
+        tracer = Tracer.from_environment()
+    middleware = []
+    if tracer:
+        middleware.append(TracingMiddleware(tracer))
+    api = falcon.API(middleware=middleware)
 
     if not storage:
-        storage = InMemoryStorage()
+        storage = ShardedStorage.from_environment() or InMemoryStorage()
     if not pushbullet:
         pushbullet = PushbulletAPI(
             os.environ.get("PUSHBULLET_API_URL",
                            "https://api.pushbullet.com/v2"))
+    if not scheduler:
+        scheduler = DeliveryScheduler()
+    if tracer:
+        storage = TracedProxy(storage, "storage")
+        pushbullet = TracedProxy(pushbullet, "pushbullet")
+    if not devices:
+        devices = DeviceRegistry(pushbullet, scheduler)
+    if not history:
+        history = NotificationHistory()
 
     api.add_route('/v1/users', UsersResource(storage))
     api.add_route('/v1/users/{username}', UserResource(storage))
     api.add_route('/v1/users/{username}/notifications',
-                  UserNotificationsResource(storage, pushbullet))
+                  UserNotificationsResource(storage, pushbullet, scheduler,
+                                            devices, history))
+    api.add_route('/v1/users/{username}/notifications/history',
+                  UserNotificationHistoryResource(storage, history))
+    api.add_route('/v1/users/{username}/devices',
+                  UserDevicesResource(storage, devices))
     api.add_route('/v1/groups', GroupsResource(storage))
     api.add_route('/v1/groups/{group_id}', GroupResource(storage))
     api.add_route('/v1/groups/{group_id}/notifications',
-                  GroupNotificationsResource(storage, pushbullet))
+                  GroupNotificationsResource(storage, pushbullet, scheduler,
+                                             history))
 
     api.add_route('/v1/notifications',
-                  NotificationsResource(storage, pushbullet))
+                  NotificationsResource(storage, pushbullet, scheduler,
+                                        history))
+    api.add_route('/v1/notifications/stream',
+                  NotificationStreamResource(storage, pushbullet, scheduler,
+                                             devices, history))
+    api.add_route('/v1/scheduler', SchedulerResource(scheduler))
+    if tracer:
+        api.add_route('/debug/traces', TracesResource(tracer))
 
     return api
 
 
-api = setup_api()
+def create_app():
+    """Build the API configured from the environment."""
+    from .utils.log import configure_from_environment
+    configure_from_environment()
+    return setup_api()
+
+
+def __getattr__(name):
+    """Build the module level api on first access.
+    This keeps ``push_notifications.server:api`` working for WSGI servers
+    that look the app up as an attribute."""
+    if name == "api":
+        global api
+        api = create_app()
+        return api
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,60 @@
+"""Consistent hashing of keys onto storage nodes."""
+import bisect
+import hashlib
+
+DEFAULT_REPLICAS = 128
+
+
+def _hash(key):
+    # md5 is used for its even spread, not for security. Python's hash()
+    # is randomised per process so it cannot be shared between nodes.
+    # Keys are hashed as strings so that any JSON scalar can be placed.
+    return int.from_bytes(hashlib.md5(str(key).encode("utf-8")).digest()[:8],
+                          "big")
+
+
+class HashRing:
+    """Maps keys to node names.
+
+    Each node is placed at `replicas` points on a ring and a key belongs
+    to the first node point after the key's hash. Adding a node only moves
+    the keys that now fall just before its points, roughly 1/N of them.
+    """
+
+    def __init__(self, nodes=(), replicas=DEFAULT_REPLICAS):
+        self._replicas = replicas
+        self._nodes = []
+        self._points = []
+        self._owners = []
+        for node in nodes:
+            self.add_node(node)
+
+    @property
+    def nodes(self):
+        return list(self._nodes)
+
+    def add_node(self, node):
+        if node in self._nodes:
+            raise ValueError("%s is already in the ring" % node)
+        self._nodes.append(node)
+        for i in range(self._replicas):
+            point = _hash("%s#%d" % (node, i))
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def copy(self):
+        ring = HashRing(replicas=self._replicas)
+        ring._nodes = list(self._nodes)
+        ring._points = list(self._points)
+        ring._owners = list(self._owners)
+        return ring
+
+    def node_for(self, key):
+        """The node owning key."""
+        if not self._points:
+            raise LookupError("The ring has no nodes")
+        index = bisect.bisect(self._points, _hash(key))
+        if index == len(self._points):
+            index = 0
+        return self._owners[index]
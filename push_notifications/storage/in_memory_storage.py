@@ -1,69 +1,158 @@
 """A local in-memory storage manager for users."""
 import datetime
+import itertools
 import threading
 from push_notifications.storage import UserNotFoundException, \
     DuplicateUserException, GroupNotFoundException, \
     DuplicateGroupException
+from push_notifications.utils.tracing import TracedLock
+
+DEFAULT_STRIPES = 64
 
 
 class InMemoryStorage:
-    """Stores users only in memory with no persistence."""
-    def __init__(self):
+    """Stores users only in memory with no persistence.
+
+    Writes to a user (registration and counter increments) are serialised
+    by one of a fixed number of locks chosen by the hash of the username,
+    so writes to different users rarely contend. Lookups take no lock.
+
+    Listings are served from immutable snapshots which are rebuilt only
+    when a user or group has been added or removed since the last one was
+    taken. Each change stores a new, unique version number, so a snapshot
+    is current exactly when its version is still the latest.
+    """
+    def __init__(self, stripes=DEFAULT_STRIPES):
         self._users = {}
         self._groups = {}
-        self._lock = threading.Lock()
+        self._stripes = [TracedLock(threading.Lock(), "storage.lock_wait")
+                         for _ in range(stripes)]
+        self._groups_lock = TracedLock(threading.Lock(), "storage.lock_wait")
+        # next() on a count is atomic, so versions never need a lock.
+        self._versions = itertools.count(1)
+        self._users_version = 0
+        self._groups_version = 0
+        self._users_snapshot = (0, ())
+        self._groups_snapshot = (0, ())
+
+    def _lock_for(self, username):
+        return self._stripes[hash(username) % len(self._stripes)]
 
     def register_user(self, username, access_token):
         """Register a new user.
         If the user already exists this will raise DuplicateUserException."""
-        with self._lock:
+        with self._lock_for(username):
             if username in self._users:
                 raise DuplicateUserException(
                     "%s already registered" % username)
-            self._users[username] = {
+            user = {
                 "username": username,
                 "accessToken": access_token,
                 "creationTime": datetime.datetime.now(),
                 "numOfNotificationsPushed": 0
             }
-            return self._users[username]
+            self._users[username] = user
+            self._users_version = next(self._versions)
+            return user
+
+    def import_user(self, user):
+        """Add a user record exported from another storage, keeping its
+        creation time and count.
+        If the user already exists this will raise DuplicateUserException."""
+        username = user["username"]
+        with self._lock_for(username):
+            if username in self._users:
+                raise DuplicateUserException(
+                    "%s already registered" % username)
+            self._users[username] = dict(user)
+            self._users_version = next(self._versions)
+
+    def remove_user(self, username):
+        """Remove a user, e.g. once it has been moved to another storage.
+        If the user does not exist this will raise UserNotFoundException."""
+        with self._lock_for(username):
+            if self._users.pop(username, None) is None:
+                raise UserNotFoundException("%s does not exist" % username)
+            self._users_version = next(self._versions)
 
     def get_users(self):
-        """Get a list of all users."""
-        return self._users.values()
+        """Get a snapshot of all users."""
+        version, snapshot = self._users_snapshot
+        current = self._users_version
+        if version != current:
+            # Copying the values happens without releasing the GIL, so the
+            # snapshot is consistent even while users are being registered.
+            snapshot = tuple(self._users.values())
+            self._users_snapshot = (current, snapshot)
+        return snapshot
 
     def get_by_username(self, username):
         """Get a user by username.
         If the user does not exist this will raise UserNotFoundException."""
-        if username in self._users:
-            return self._users[username]
-        raise UserNotFoundException("%s does not exist" % username)
-
-    def register_group(self, group_id, user_ids):
-        """Register a group of users."""
-        if group_id in self._groups:
-            raise DuplicateGroupException(
-                "%s is already registered" % group_id)
-        for user_id in user_ids:
-            if user_id not in self._users:
-                raise UserNotFoundException("%s not found" % user_id)
-        self._groups[group_id] = user_ids
+        user = self._users.get(username)
+        if user is None:
+            raise UserNotFoundException("%s does not exist" % username)
+        return user
+
+    def get_by_usernames(self, usernames):
+        """Get several users at once.
+        Returns a dict of the users found by username."""
+        users = self._users
+        return {username: users[username] for username in usernames
+                if username in users}
+
+    def find_missing_users(self, usernames):
+        """Return those of usernames which are not registered."""
+        return [username for username in usernames
+                if username not in self._users]
+
+    def register_group(self, group_id, user_ids, validate=True):
+        """Register a group of users.
+        The group is only registered if every user exists, unless validate
+        is False because the users are held by other storages."""
+        with self._groups_lock:
+            if group_id in self._groups:
+                raise DuplicateGroupException(
+                    "%s is already registered" % group_id)
+            if validate:
+                missing = self.find_missing_users(user_ids)
+                if missing:
+                    raise UserNotFoundException("%s not found" % missing[0])
+            self._groups[group_id] = list(user_ids)
+            self._groups_version = next(self._versions)
+
+    def remove_group(self, group_id):
+        """Remove a group.
+        If the group does not exist this will raise GroupNotFoundException."""
+        with self._groups_lock:
+            if self._groups.pop(group_id, None) is None:
+                raise GroupNotFoundException("%s does not exist" % group_id)
+            self._groups_version = next(self._versions)
 
     def get_group(self, group_id):
         """Get a group by group id."""
-        if group_id in self._groups:
-            return self._groups[group_id]
-        raise GroupNotFoundException("%s does not exist" % group_id)
+        group = self._groups.get(group_id)
+        if group is None:
+            raise GroupNotFoundException("%s does not exist" % group_id)
+        return group
 
     def get_groups(self):
-        """Return all groups."""
-        return list(self._groups.values())
+        """Return a snapshot of all groups."""
+        version, snapshot = self._groups_snapshot
+        current = self._groups_version
+        if version != current:
+            snapshot = tuple(self._groups.values())
+            self._groups_snapshot = (current, snapshot)
+        return snapshot
 
-    def increment_notifications_pushed(self, username):
-        """Increment numOfNotificationsPushed for the given user.
+    def get_group_ids(self):
+        """Return the ids of all groups."""
+        return list(self._groups)
+
+    def increment_notifications_pushed(self, username, count=1):
+        """Increase numOfNotificationsPushed for the given user by count.
         If the user does not exist this will raise UserNotFoundException."""
-        with self._lock:
+        with self._lock_for(username):
             user = self.get_by_username(username)
-            user["numOfNotificationsPushed"] += 1
-            self._users[username] = user
-        return user["numOfNotificationsPushed"]
+            user["numOfNotificationsPushed"] += count
+            return user["numOfNotificationsPushed"]
@@ -0,0 +1,155 @@
+"""A storage node: an InMemoryStorage served over HTTP.
+
+Nodes are used by ShardedStorage through RemoteStorage clients. Each
+storage method is called with ``POST /storage/{method}`` and a JSON body of
+``{"args": [...]}``. The result is returned as ``{"result": ...}``; storage
+exceptions are returned as a 404 or 409 with ``{"error": name,
+"message": ...}``.
+
+A node keeps its users in memory, so it must run as a single process:
+
+    python -m push_notifications.storage.node --port 9001
+"""
+import argparse
+import falcon
+from push_notifications.storage import UserNotFoundException, \
+    DuplicateUserException, GroupNotFoundException, DuplicateGroupException
+from push_notifications.storage.in_memory_storage import InMemoryStorage
+from push_notifications.utils.falcon import decode_json_request
+from push_notifications.utils.json import json_dump
+
+METHODS = frozenset([
+    "register_user", "import_user", "remove_user", "get_users",
+    "get_by_username", "get_by_usernames", "find_missing_users",
+    "increment_notifications_pushed", "register_group", "remove_group",
+    "get_group", "get_groups", "get_group_ids",
+])
+
+ERRORS = {
+    UserNotFoundException: falcon.HTTP_404,
+    GroupNotFoundException: falcon.HTTP_404,
+    DuplicateUserException: falcon.HTTP_409,
+    DuplicateGroupException: falcon.HTTP_409,
+}
+
+
+class StorageMethodResource:
+    """Resource calling a method of the node's storage."""
+
+    def __init__(self, storage):
+        self._storage = storage
+
+    def on_post(self, req, resp, method):
+        if method not in METHODS:
+            raise falcon.HTTPNotFound()
+        data = decode_json_request(req, ["args"])
+        try:
+            result = getattr(self._storage, method)(*data["args"])
+        except tuple(ERRORS) as e:
+            resp.status = ERRORS[type(e)]
+            resp.body = json_dump({"error": type(e).__name__,
+                                   "message": str(e)})
+            return
+        if isinstance(result, tuple):
+            result = list(result)
+        resp.body = json_dump({"result": result})
+
+
+def create_app(storage=None):
+    """Build a node app serving the given storage."""
+    api = falcon.API()
+    api.add_route('/storage/{method}',
+                  StorageMethodResource(storage or InMemoryStorage()))
+    return api
+
+
+def make_server(host, port, storage=None):
+    """Create a threaded WSGI server for a node.
+    Pass port 0 to pick a free port.
+
+    The server speaks HTTP/1.1 and keeps connections open between
+    requests, so each RemoteStorage session reuses its connection."""
+    import io
+    from http.server import BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, \
+        ServerHandler, make_server as wsgiref_make_server
+
+    class Server(ThreadingMixIn, WSGIServer):
+        # The default backlog of 5 drops connections when many clients
+        # connect at once, adding retransmission delays of a second.
+        request_queue_size = 128
+        daemon_threads = True
+
+    class KeepAliveServerHandler(ServerHandler):
+        http_version = "1.1"
+
+        def cleanup_headers(self):
+            super().cleanup_headers()
+            if "Content-Length" not in self.headers:
+                # The body can only be delimited by closing the connection.
+                self.headers["Connection"] = "close"
+                self.request_handler.close_connection = True
+
+    class Handler(WSGIRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # The status line, headers and body are separate writes; without
+        # this, responses wait for the client's delayed ACK.
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def handle(self):
+            # Serve requests until the client closes the connection.
+            BaseHTTPRequestHandler.handle(self)
+
+        def handle_one_request(self):
+            self.raw_requestline = self.rfile.readline(65537)
+            if not self.raw_requestline:
+                self.close_connection = True
+                return
+            if len(self.raw_requestline) > 65536:
+                self.requestline = ''
+                self.request_version = ''
+                self.command = ''
+                self.send_error(414)
+                return
+            if not self.parse_request():
+                return
+            if "Transfer-Encoding" in self.headers:
+                # Only bodies with a Content-Length can be read here.
+                self.send_error(411)
+                return
+            # The body is read in full so that the next request starts at
+            # the right place, even if the app does not read all of it.
+            length = int(self.headers.get("Content-Length") or 0)
+            handler = KeepAliveServerHandler(
+                io.BytesIO(self.rfile.read(length)), self.wfile,
+                self.get_stderr(), self.get_environ())
+            handler.request_handler = self
+            handler.run(self.server.get_app())
+
+    return wsgiref_make_server(host, port, create_app(storage),
+                               server_class=Server, handler_class=Handler)
+
+
+def serve(host, port, storage=None):
+    """Serve a node until interrupted."""
+    httpd = make_server(host, port, storage)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    args = parser.parse_args()
+    serve(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
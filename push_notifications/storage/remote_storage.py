@@ -0,0 +1,91 @@
+"""Client for a storage node served by push_notifications.storage.node."""
+import json
+import threading
+from push_notifications.storage import UserNotFoundException, \
+    DuplicateUserException, GroupNotFoundException, DuplicateGroupException
+
+EXCEPTIONS = {exception.__name__: exception for exception in (
+    UserNotFoundException, DuplicateUserException,
+    GroupNotFoundException, DuplicateGroupException)}
+
+
+class StorageNodeException(Exception):
+    """The storage node failed to handle a request."""
+    pass
+
+
+class RemoteStorage:
+    """Storage held by a node process, with the InMemoryStorage interface.
+    Each thread keeps its own HTTP session so connections are reused."""
+
+    def __init__(self, url, timeout=10):
+        self._url = url.rstrip("/")
+        self._timeout = timeout
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            import requests
+            session = self._local.session = requests.Session()
+        return session
+
+    def _call(self, method, *args):
+        response = self._session().post(
+            "%s/storage/%s" % (self._url, method),
+            # Sent as bytes so that http.client writes the headers and
+            # body together rather than waiting on a delayed ACK between.
+            data=json.dumps({"args": args}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            timeout=self._timeout)
+        if response.status_code == 200:
+            return response.json()["result"]
+        try:
+            error = response.json()
+        except ValueError:
+            error = {}
+        exception = EXCEPTIONS.get(error.get("error"))
+        if exception is not None:
+            raise exception(error.get("message"))
+        raise StorageNodeException("%s returned %d for %s" % (
+            self._url, response.status_code, method))
+
+    def register_user(self, username, access_token):
+        return self._call("register_user", username, access_token)
+
+    def import_user(self, user):
+        return self._call("import_user", user)
+
+    def remove_user(self, username):
+        return self._call("remove_user", username)
+
+    def get_users(self):
+        return self._call("get_users")
+
+    def get_by_username(self, username):
+        return self._call("get_by_username", username)
+
+    def get_by_usernames(self, usernames):
+        return self._call("get_by_usernames", list(usernames))
+
+    def find_missing_users(self, usernames):
+        return self._call("find_missing_users", list(usernames))
+
+    def increment_notifications_pushed(self, username, count=1):
+        return self._call("increment_notifications_pushed", username, count)
+
+    def register_group(self, group_id, user_ids, validate=True):
+        return self._call("register_group", group_id, list(user_ids),
+                          validate)
+
+    def remove_group(self, group_id):
+        return self._call("remove_group", group_id)
+
+    def get_group(self, group_id):
+        return self._call("get_group", group_id)
+
+    def get_groups(self):
+        return self._call("get_groups")
+
+    def get_group_ids(self):
+        return self._call("get_group_ids")
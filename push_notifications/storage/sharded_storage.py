@@ -0,0 +1,186 @@
+"""Storage partitioned across several storage nodes."""
+import collections
+import contextlib
+import os
+import threading
+from push_notifications.storage import UserNotFoundException
+from push_notifications.storage.hash_ring import HashRing
+
+
+class ShardedStorage:
+    """Spreads users and their counters across storage nodes.
+
+    Each user lives on the node the consistent hash ring picks for their
+    username, and each group on the node picked for its id. The nodes can
+    be any storage with the InMemoryStorage interface, either in this
+    process or RemoteStorage clients for separate node processes.
+    """
+
+    def __init__(self, nodes):
+        """nodes maps node names to storages."""
+        self._nodes = dict(nodes)
+        self._ring = HashRing(self._nodes)
+        self._rebalance_lock = threading.Lock()
+        # Registrations wait while a node is added, see add_node.
+        self._moves = threading.Condition()
+        self._moving = False
+        self._registering = 0
+
+    @classmethod
+    def from_environment(cls, environ=os.environ):
+        """Build a ShardedStorage of RemoteStorage clients from the comma
+        separated node URLs in STORAGE_NODES, or return None."""
+        urls = environ.get("STORAGE_NODES")
+        if not urls:
+            return None
+        from push_notifications.storage.remote_storage import RemoteStorage
+        return cls({url: RemoteStorage(url)
+                    for url in urls.split(",") if url})
+
+    @property
+    def nodes(self):
+        return dict(self._nodes)
+
+    def node_name_for(self, username):
+        return self._ring.node_for(username)
+
+    def _user_node(self, username):
+        return self._nodes[self._ring.node_for(username)]
+
+    def _group_node(self, group_id):
+        return self._nodes[self._ring.node_for("group:%s" % group_id)]
+
+    def partition(self, usernames):
+        """Split usernames by the node holding them.
+        Returns an ordered mapping of node name to usernames."""
+        shards = collections.OrderedDict()
+        node_for = self._ring.node_for
+        for username in usernames:
+            shards.setdefault(node_for(username), []).append(username)
+        return shards
+
+    @contextlib.contextmanager
+    def _registration(self):
+        with self._moves:
+            while self._moving:
+                self._moves.wait()
+            self._registering += 1
+        try:
+            yield
+        finally:
+            with self._moves:
+                self._registering -= 1
+                self._moves.notify_all()
+
+    def register_user(self, username, access_token):
+        with self._registration():
+            return self._user_node(username).register_user(username,
+                                                           access_token)
+
+    def get_users(self):
+        users = []
+        for node in self._nodes.values():
+            users.extend(node.get_users())
+        return users
+
+    def get_by_username(self, username):
+        return self._user_node(username).get_by_username(username)
+
+    def get_by_usernames(self, usernames):
+        """Get several users, with one call to each node holding them."""
+        users = {}
+        for node_name, names in self.partition(usernames).items():
+            users.update(self._nodes[node_name].get_by_usernames(names))
+        return users
+
+    def increment_notifications_pushed(self, username, count=1):
+        return self._user_node(username).increment_notifications_pushed(
+            username, count)
+
+    def register_group(self, group_id, user_ids):
+        """Register a group of users held on any node.
+        Users are never removed, only moved, so once checked they stay
+        valid and the group's node does not need to check them again."""
+        with self._registration():
+            for node_name, usernames in self.partition(user_ids).items():
+                missing = self._nodes[node_name].find_missing_users(
+                    usernames)
+                if missing:
+                    raise UserNotFoundException("%s not found" % missing[0])
+            self._group_node(group_id).register_group(group_id, user_ids,
+                                                      validate=False)
+
+    def get_group(self, group_id):
+        return self._group_node(group_id).get_group(group_id)
+
+    def get_groups(self):
+        groups = []
+        for node in self._nodes.values():
+            groups.extend(node.get_groups())
+        return groups
+
+    def add_node(self, name, node):
+        """Add a node and move the users and groups it now owns onto it.
+
+        Registrations through this storage wait until the move is done, so
+        every user and group is either copied or registered on its new
+        node. Users are copied to the new node before the ring is switched,
+        so they can be found throughout. Increments made on the old node
+        while copying are then added to the new node before the old copy
+        is removed; increments routed before the switch that have not
+        finished by the end of the move may still be lost.
+
+        Other processes only see the new node once restarted with it in
+        STORAGE_NODES, and their registrations are not held back, so stop
+        them (or their registrations) while adding a node.
+        Returns the number of users and groups moved.
+        """
+        with self._rebalance_lock:
+            with self._moves:
+                self._moving = True
+                while self._registering:
+                    self._moves.wait()
+            try:
+                return self._move_to(name, node)
+            finally:
+                with self._moves:
+                    self._moving = False
+                    self._moves.notify_all()
+
+    def _move_to(self, name, node):
+        """Copy the keys the new node owns, switch the ring and remove the
+        old copies. Must be called with registrations held back."""
+        ring = self._ring.copy()
+        ring.add_node(name)
+        moved_users = []
+        moved_groups = []
+        for old_node in self._nodes.values():
+            for user in old_node.get_users():
+                if ring.node_for(user["username"]) == name:
+                    # Copy first, as in-process records are live.
+                    user = dict(user)
+                    node.import_user(user)
+                    moved_users.append(
+                        (old_node, user["username"],
+                         user["numOfNotificationsPushed"]))
+            for group_id in old_node.get_group_ids():
+                if ring.node_for("group:%s" % group_id) == name:
+                    node.register_group(group_id,
+                                        old_node.get_group(group_id),
+                                        validate=False)
+                    moved_groups.append((old_node, group_id))
+
+        nodes = dict(self._nodes)
+        nodes[name] = node
+        self._nodes = nodes
+        self._ring = ring
+
+        for old_node, username, copied in moved_users:
+            final = old_node.get_by_username(username)
+            missed = final["numOfNotificationsPushed"] - copied
+            if missed:
+                node.increment_notifications_pushed(username, missed)
+            old_node.remove_user(username)
+        for old_node, group_id in moved_groups:
+            old_node.remove_group(group_id)
+        return len(moved_users), len(moved_groups)
@@ -2,8 +2,10 @@
 import json
 import codecs
 import falcon
+from push_notifications.utils.tracing import traced
 
 
+@traced("decode_json_request")
 def decode_json_request(request, keys=[]):
     """Decode a json request.
     If any of the required keys are not included,
@@ -16,3 +18,70 @@ def decode_json_request(request, keys=[]):
         if key not in data:
             raise falcon.HTTPBadRequest("Missing required data '%s'" % key)
     return data
+
+
+# Longest NDJSON record accepted, in bytes.
+MAX_NDJSON_LINE = 64 * 1024
+
+
+class InvalidRecord:
+    """A line of an NDJSON request that could not be used."""
+    def __init__(self, message):
+        self.message = message
+
+
+def iter_ndjson_request(request, keys=[]):
+    """Incrementally decode a newline-delimited JSON request.
+    Yields (line_number, record) for each non-blank line, reading only as
+    much of the body as has been consumed. record is an InvalidRecord if
+    the line is not a JSON object containing all the required keys as
+    strings."""
+    # Falcon's bounded stream counts the size asked for rather than the
+    # bytes returned by readline, so the body is bounded here instead.
+    stream = request.env["wsgi.input"]
+    remaining = request.content_length
+
+    def readline():
+        nonlocal remaining
+        if remaining is None:
+            # Chunked uploads have no length; the server ends the stream.
+            return stream.readline(MAX_NDJSON_LINE)
+        if remaining <= 0:
+            return b""
+        line = stream.readline(min(MAX_NDJSON_LINE, remaining))
+        remaining -= len(line)
+        return line
+
+    line_number = 0
+    while True:
+        line = readline()
+        if not line:
+            return
+        line_number += 1
+        if not line.endswith(b"\n") and len(line) == MAX_NDJSON_LINE:
+            # Discard the rest of an over-long line.
+            while line and not line.endswith(b"\n"):
+                line = readline()
+            yield line_number, InvalidRecord("Line too long")
+            continue
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line.decode("utf-8"))
+        except ValueError:
+            yield line_number, InvalidRecord("Invalid JSON")
+            continue
+        if not isinstance(data, dict):
+            yield line_number, InvalidRecord("Expected a JSON object")
+            continue
+        missing = [key for key in keys if key not in data]
+        if missing:
+            yield line_number, InvalidRecord(
+                "Missing required data '%s'" % missing[0])
+            continue
+        invalid = [key for key in keys if not isinstance(data[key], str)]
+        if invalid:
+            yield line_number, InvalidRecord(
+                "Expected a string for '%s'" % invalid[0])
+            continue
+        yield line_number, data
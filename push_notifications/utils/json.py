@@ -2,6 +2,7 @@
 
 import json
 from datetime import datetime
+from push_notifications.utils.tracing import traced
 
 
 def _json_serial(obj):
@@ -12,6 +13,7 @@ def _json_serial(obj):
     raise TypeError("Type not serializable")
 
 
+@traced("json_dump")
 def json_dump(obj):
     """Dump JSON to text.
     This applies additional serializing functions over json.dumps."""
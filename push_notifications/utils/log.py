@@ -0,0 +1,221 @@
+"""Logging pipeline that keeps log writes off the request path.
+
+Handlers on the request path only put the record on a queue. A background
+thread takes records off the queue, formats them (so % formatting of the
+message happens there, not in the handler) and writes them to the sink in
+batches. Per-user delivery messages, which a broadcast produces thousands
+of, go to their own logger and can be sampled.
+"""
+import itertools
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import weakref
+from datetime import datetime
+
+# Logger used for the per-user "Notification pushed" messages.
+DELIVERY_LOGGER = 'notifications_api.deliveries'
+
+# Attributes every LogRecord has; anything else was passed as extra.
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord(
+    "", logging.INFO, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as a single line of JSON.
+    Fields passed with extra= are included in the record."""
+
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                data[key] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Lets through one in every `every` records."""
+
+    def __init__(self, every):
+        super().__init__()
+        self._every = max(1, int(every))
+        self._counter = itertools.count()
+
+    def filter(self, record):
+        return next(self._counter) % self._every == 0
+
+
+# Handlers to reset in forked children, see BatchingQueueHandler._after_fork.
+_handlers = weakref.WeakSet()
+
+
+def _reset_handlers_after_fork():
+    for handler in list(_handlers):
+        handler._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_handlers_after_fork)
+
+
+class BatchingQueueHandler(logging.Handler):
+    """Queues records for a background thread which formats them and
+    writes them to the sink in batches.
+
+    emit never blocks: if the queue is full the record is dropped and
+    counted in `dropped`. The writer thread is started by the first
+    record, so a handler set up before forking writes from each child.
+    Errors writing to the sink are reported with handleError and the
+    batch is dropped, so the writer keeps running. flush and close wait
+    at most flush_timeout seconds.
+    """
+
+    def __init__(self, sink=None, batch_size=256, flush_interval=0.5,
+                 max_queue=100000, flush_timeout=5.0):
+        super().__init__()
+        self._sink = sink or sys.stderr
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._flush_timeout = flush_timeout
+        self._max_queue = max_queue
+        self._queue = queue.Queue(max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.dropped = 0
+        _handlers.add(self)
+
+    def emit(self, record):
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._write,
+                                          name="log-writer")
+                thread.daemon = True
+                thread.start()
+                self._thread = thread
+
+    def _after_fork(self):
+        """The writer thread does not survive fork; records queued in the
+        parent were written (or will be) by the parent."""
+        self._queue = queue.Queue(self._max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _write(self):
+        records = self._queue
+        while True:
+            try:
+                batch = [records.get(timeout=self._flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(records.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    records.task_done()
+            if stop:
+                return
+
+    def _write_batch(self, batch):
+        lines = []
+        for record in batch:
+            if record is None:
+                continue
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        if not lines:
+            return
+        try:
+            self._sink.write("\n".join(lines) + "\n")
+            self._sink.flush()
+        except Exception:
+            self.handleError(next(r for r in batch if r is not None))
+
+    def flush(self):
+        """Wait until every queued record has been written, for at most
+        flush_timeout seconds."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        records = self._queue
+        deadline = time.monotonic() + self._flush_timeout
+        with records.all_tasks_done:
+            while records.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                records.all_tasks_done.wait(remaining)
+
+    def close(self):
+        thread = self._thread
+        if thread is not None:
+            if thread.is_alive():
+                try:
+                    self._queue.put(None, timeout=self._flush_timeout)
+                except queue.Full:
+                    pass
+                thread.join(self._flush_timeout)
+            self._thread = None
+        super().close()
+
+
+def configure_logging(level=logging.INFO, sink=None, sample_every=1,
+                      batch_size=256, flush_interval=0.5):
+    """Send the service's logs through a BatchingQueueHandler as JSON.
+    Only one in every sample_every per-user delivery messages is kept.
+    Returns the handler."""
+    handler = BatchingQueueHandler(sink, batch_size=batch_size,
+                                   flush_interval=flush_interval)
+    handler.setFormatter(JsonFormatter())
+    logger = logging.getLogger('notifications_api')
+    for existing in list(logger.handlers):
+        if isinstance(existing, BatchingQueueHandler):
+            logger.removeHandler(existing)
+            existing.close()
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+    deliveries = logging.getLogger(DELIVERY_LOGGER)
+    deliveries.filters = [f for f in deliveries.filters
+                          if not isinstance(f, SamplingFilter)]
+    if sample_every > 1:
+        deliveries.addFilter(SamplingFilter(sample_every))
+    return handler
+
+
+def configure_from_environment(environ=os.environ):
+    """Configure logging if LOG_JSON=1, using LOG_LEVEL and
+    LOG_SAMPLE_EVERY. Returns the handler, or None."""
+    if environ.get("LOG_JSON") != "1":
+        return None
+    return configure_logging(
+        level=environ.get("LOG_LEVEL", "INFO").upper(),
+        sample_every=int(environ.get("LOG_SAMPLE_EVERY", 1)))
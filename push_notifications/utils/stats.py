@@ -0,0 +1,9 @@
+"""Statistics helpers."""
+
+
+def percentile(ordered, percent):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    index = max(0, int(round(percent / 100.0 * len(ordered))) - 1)
+    return ordered[index]
@@ -0,0 +1,294 @@
+"""Request tracing and profiling.
+
+A Tracer records timed spans for the phases of a request (JSON decoding,
+storage calls, lock waits, Pushbullet calls, JSON encoding) and keeps the
+traces of sampled or slow requests for inspection.
+
+The trace for the current request is held in a context variable, so spans
+recorded by delivery jobs running on scheduler threads are attributed to
+the request that queued them. When no request is being traced, span() and
+traced functions cost a single context variable lookup.
+"""
+import contextvars
+import functools
+import itertools
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+# Number of lines of profiler output attached to slow traces.
+PROFILE_LINES = 30
+
+
+class Trace:
+    """Spans recorded while handling a single request."""
+
+    def __init__(self, trace_id, method, path, sampled):
+        self.id = trace_id
+        self.method = method
+        self.path = path
+        self.sampled = sampled
+        self.start = time.perf_counter()
+        self.duration = None
+        self.status = None
+        self.spans = []
+        self.profile = None
+
+    def add_span(self, name, start, end):
+        # list.append is atomic, spans may come from several threads.
+        self.spans.append((name, start, end - start,
+                           threading.current_thread().name))
+
+    def to_dict(self):
+        phases = {}
+        for name, _, duration, _ in self.spans:
+            phases[name] = phases.get(name, 0.0) + duration
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "sampled": self.sampled,
+            "durationMs": _ms(self.duration or 0.0),
+            "phases": {name: _ms(total) for name, total in phases.items()},
+            "spans": [{"name": name,
+                       "startMs": _ms(start - self.start),
+                       "durationMs": _ms(duration),
+                       "thread": thread}
+                      for name, start, duration, thread in self.spans],
+            "profile": self.profile,
+        }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def current_trace():
+    """The trace of the request being handled, or None."""
+    return _current_trace.get()
+
+
+def add_span(name, start, end):
+    """Record a span with explicit perf_counter times."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(name, start, end)
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block as a span of the current trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_span(name, start, time.perf_counter())
+
+
+def traced(name):
+    """Decorate a function so each call is recorded as a span."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            trace = _current_trace.get()
+            if trace is None:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                trace.add_span(name, start, time.perf_counter())
+        return wrapper
+    return decorator
+
+
+class TracedLock:
+    """Wraps a lock, recording the time spent waiting for it as a span."""
+
+    def __init__(self, lock, name):
+        self._lock = lock
+        self._name = name
+
+    def __enter__(self):
+        trace = _current_trace.get()
+        if trace is None:
+            self._lock.acquire()
+        else:
+            start = time.perf_counter()
+            self._lock.acquire()
+            trace.add_span(self._name, start, time.perf_counter())
+        return self
+
+    def __exit__(self, *exc_info):
+        self._lock.release()
+
+
+class TracedProxy:
+    """Wraps an object (e.g. storage or the Pushbullet API) so each
+    method call is recorded as a span named prefix.method."""
+
+    def __init__(self, target, prefix):
+        self._target = target
+        self._prefix = prefix
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+        wrapper = traced("%s.%s" % (self._prefix, name))(attribute)
+        # Cache so later lookups skip __getattr__.
+        setattr(self, name, wrapper)
+        return wrapper
+
+
+class Tracer:
+    """Decides which requests to keep and stores their traces.
+
+    Every request is traced while the tracer is installed. The trace is
+    kept if the request was sampled (with probability sample_rate) or if
+    it took at least slow_ms. With profile_slow, each request also runs
+    under cProfile and the profile is attached to traces kept for being
+    slow; this is expensive and intended for debugging.
+    """
+
+    def __init__(self, sample_rate=0.0, slow_ms=None, profile_slow=False,
+                 max_traces=100):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.profile_slow = profile_slow and slow_ms is not None
+        self._traces = deque(maxlen=max_traces)
+        self._ids = itertools.count(1)
+
+    @classmethod
+    def from_environment(cls, environ=os.environ):
+        """Build a tracer from TRACE_SAMPLE_RATE, TRACE_SLOW_MS and
+        TRACE_PROFILE_SLOW. Returns None if tracing is not configured."""
+        sample_rate = environ.get("TRACE_SAMPLE_RATE")
+        slow_ms = environ.get("TRACE_SLOW_MS")
+        if sample_rate is None and slow_ms is None:
+            return None
+        return cls(sample_rate=float(sample_rate or 0.0),
+                   slow_ms=float(slow_ms) if slow_ms is not None else None,
+                   profile_slow=environ.get("TRACE_PROFILE_SLOW") == "1")
+
+    def start(self, method, path):
+        """Start tracing a request in the current context.
+        Returns the state to pass to finish."""
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        trace = Trace(next(self._ids), method, path, sampled)
+        profiler = None
+        if self.profile_slow:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return trace, _current_trace.set(trace), profiler
+
+    def finish(self, state, status):
+        """Finish tracing a request, keeping the trace if required."""
+        trace, token, profiler = state
+        if profiler is not None:
+            profiler.disable()
+        if token is not None:
+            _current_trace.reset(token)
+        trace.duration = time.perf_counter() - trace.start
+        trace.status = status
+        slow = (self.slow_ms is not None and
+                trace.duration * 1000 >= self.slow_ms)
+        if slow and profiler is not None:
+            import io
+            import pstats
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output) \
+                .sort_stats("cumulative").print_stats(PROFILE_LINES)
+            trace.profile = output.getvalue()
+        if slow or trace.sampled:
+            self._traces.append(trace)
+        return trace
+
+    def traces(self):
+        """Kept traces, most recent first."""
+        return [trace.to_dict() for trace in reversed(list(self._traces))]
+
+    def clear(self):
+        self._traces.clear()
+
+
+class TracedStream:
+    """Wraps a streamed response body so the request's trace stays open
+    until the WSGI server closes it. Each chunk is produced inside the
+    trace, and the trace is finished when the body is closed."""
+
+    def __init__(self, tracer, stream, state, status):
+        self._tracer = tracer
+        self._stream = stream
+        self._iterator = iter(stream)
+        self._status = status
+        # Detach the trace from the request's context until iterated.
+        trace, token, profiler = state
+        if profiler is not None:
+            profiler.disable()
+        _current_trace.reset(token)
+        self._state = (trace, None, profiler)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self._run(next, self._iterator)
+
+    def close(self):
+        if self._state is None:
+            return
+        close = getattr(self._stream, "close", None)
+        try:
+            if close is not None:
+                self._run(close)
+        finally:
+            state, self._state = self._state, None
+            self._tracer.finish(state, self._status)
+
+    def _run(self, fn, *args):
+        trace, _, profiler = self._state
+        token = _current_trace.set(trace)
+        if profiler is not None:
+            profiler.enable()
+        try:
+            return fn(*args)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            _current_trace.reset(token)
+
+
+class TracingMiddleware:
+    """Falcon middleware tracing every request with the given Tracer.
+    Requests to the debug endpoints themselves are not traced. Streamed
+    responses are traced until the body has been sent."""
+
+    def __init__(self, tracer):
+        self._tracer = tracer
+
+    def process_request(self, req, resp):
+        if req.path.startswith("/debug/"):
+            return
+        req.context["trace"] = self._tracer.start(req.method, req.path)
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        state = req.context.pop("trace", None)
+        if state is None:
+            return
+        if resp.stream is not None and not hasattr(resp.stream, "read"):
+            resp.stream = TracedStream(self._tracer, resp.stream, state,
+                                       resp.status)
+        else:
+            self._tracer.finish(state, resp.status)
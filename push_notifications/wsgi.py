@@ -0,0 +1,10 @@
+"""WSGI entry point.
+
+    gunicorn push_notifications.wsgi:api
+
+With ``--preload`` the app is built once in the gunicorn master and shared
+copy-on-write with the workers; see gunicorn.conf.py.
+"""
+from push_notifications.server import create_app
+
+api = create_app()
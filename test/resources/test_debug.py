@@ -0,0 +1,57 @@
+from falcon import testing
+import falcon
+import json
+from push_notifications import server
+from push_notifications.storage.in_memory_storage import InMemoryStorage
+from push_notifications.utils.tracing import Tracer
+from unittest.mock import MagicMock
+
+
+class TestDebug(testing.TestCase):
+    def setUp(self):
+        self._storage = InMemoryStorage()
+        self._pushbullet = MagicMock()
+        self._tracer = Tracer(sample_rate=1.0)
+        self.app = server.setup_api(self._storage, self._pushbullet,
+                                    tracer=self._tracer)
+
+        self._storage.register_user("user1", "code1")
+
+    def test_traces(self):
+        """Traces of requests are listed with their phases."""
+        self.simulate_post(
+            "/v1/users/user1/notifications", body=json.dumps({
+                "title": "test_title", "body": "test_body"
+            })
+        )
+        result = self.simulate_get("/debug/traces")
+        self.assertEqual(result.status, falcon.HTTP_200)
+        trace = result.json[0]
+        self.assertEqual(trace["path"], "/v1/users/user1/notifications")
+        for phase in ("decode_json_request", "storage.get_by_username",
+                      "pushbullet.create_push", "json_dump"):
+            self.assertIn(phase, trace["phases"])
+
+    def test_stream_traced(self):
+        """Streamed requests are traced until the body has been sent."""
+        body = json.dumps({"username": "user1", "title": "t", "body": "b"})
+        self.simulate_post("/v1/notifications/stream", body=body)
+        result = self.simulate_get("/debug/traces")
+        trace = result.json[0]
+        self.assertEqual(trace["path"], "/v1/notifications/stream")
+        for phase in ("storage.get_by_username", "pushbullet.create_push",
+                      "scheduler.queue_wait"):
+            self.assertIn(phase, trace["phases"])
+
+    def test_clear_traces(self):
+        """Traces can be discarded."""
+        self.simulate_get("/v1/users")
+        self.simulate_delete("/debug/traces")
+        result = self.simulate_get("/debug/traces")
+        self.assertEqual(result.json, [])
+
+    def test_disabled(self):
+        """The debug endpoint is only available when tracing."""
+        self.app = server.setup_api(self._storage, self._pushbullet)
+        result = self.simulate_get("/debug/traces")
+        self.assertEqual(result.status, falcon.HTTP_404)
@@ -3,6 +3,8 @@ import falcon
 import json
 from push_notifications import server
 from push_notifications.storage.in_memory_storage import InMemoryStorage
+from push_notifications.storage.sharded_storage import ShardedStorage
+from push_notifications.scheduler import DeliveryScheduler
 from unittest.mock import MagicMock
 
 
@@ -56,3 +58,65 @@ class TestGroups(testing.TestCase):
             "users": ["user2"]
             }))
         self.assertEqual(result.status, falcon.HTTP_400)
+
+    def test_notify_group(self):
+        """Send a notification to every user in a group."""
+        self._storage.register_user("user2", "code2")
+        self._storage.register_group("group1", ["user1", "user2"])
+        result = self.simulate_post(
+            "/v1/groups/group1/notifications", body=json.dumps({
+                "title": "test_title", "body": "test_body"
+            })
+        )
+        self.assertEqual(result.status, falcon.HTTP_201)
+        self.assertEqual(result.json["errors"], [])
+        self.assertEqual(self._pushbullet.create_push.call_count, 2)
+        self._pushbullet.create_push.assert_any_call(
+            "code2", "test_title", "test_body")
+        user = self._storage.get_by_username("user2")
+        self.assertEqual(user["numOfNotificationsPushed"], 1)
+        result = self.simulate_get("/v1/users/user2/notifications/history")
+        self.assertEqual(result.json["notifications"][0]["title"],
+                         "test_title")
+
+    def test_notify_missing_group(self):
+        """Send a notification to a group that isn't registered."""
+        result = self.simulate_post(
+            "/v1/groups/group1/notifications", body=json.dumps({
+                "title": "test_title", "body": "test_body"
+            })
+        )
+        self.assertEqual(result.status, falcon.HTTP_404)
+
+    def test_notify_group_sharded(self):
+        """Send a notification to a group spread over storage nodes."""
+        storage = ShardedStorage({"node%d" % i: InMemoryStorage()
+                                  for i in range(3)})
+        scheduler = DeliveryScheduler(workers=2)
+        submit = scheduler.submit
+        flows = []
+
+        def record_flow(lane, flow, fn, *args):
+            flows.append((flow, getattr(fn, "__name__", None)))
+            return submit(lane, flow, fn, *args)
+        scheduler.submit = record_flow
+        self.app = server.setup_api(storage, self._pushbullet, scheduler)
+        users = ["user%d" % i for i in range(10)]
+        for user in users:
+            storage.register_user(user, "code")
+        storage.register_group("group1", users)
+        result = self.simulate_post(
+            "/v1/groups/group1/notifications", body=json.dumps({
+                "title": "test_title", "body": "test_body"
+            })
+        )
+        self.assertEqual(result.status, falcon.HTTP_201)
+        self.assertEqual(self._pushbullet.create_push.call_count, 10)
+        for user in users:
+            self.assertEqual(storage.get_by_username(user)
+                             ["numOfNotificationsPushed"], 1)
+        # One flow for the whole send, and one lookup per node.
+        self.assertEqual({flow for flow, _ in flows}, {"group:group1"})
+        self.assertEqual([name for _, name in flows].count(
+            "get_by_usernames"), len(storage.partition(users)))
+        scheduler.shutdown()
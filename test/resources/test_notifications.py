@@ -3,6 +3,7 @@ import falcon
 import json
 from push_notifications import server
 from push_notifications.storage.in_memory_storage import InMemoryStorage
+from push_notifications.history import NotificationHistory
 from unittest.mock import MagicMock
 
 
@@ -10,7 +11,9 @@ class TestNotifications(testing.TestCase):
     def setUp(self):
         self._storage = InMemoryStorage()
         self._pushbullet = MagicMock()
-        self.app = server.setup_api(self._storage, self._pushbullet)
+        self._history = NotificationHistory()
+        self.app = server.setup_api(self._storage, self._pushbullet,
+                                    history=self._history)
 
         self._storage.register_user("user1", "code1")
         self._storage.register_user("user2", "code2")
@@ -25,3 +28,85 @@ class TestNotifications(testing.TestCase):
                 "body": "body"
             }))
         self.assertEqual(result.status, falcon.HTTP_201)
+
+    def test_send_to_integer_group(self):
+        """Group ids do not have to be strings."""
+        self._storage.register_group(1, ["user1"])
+        result = self.simulate_post("/v1/notifications", body=json.dumps({
+                "groupIds": [1],
+                "title": "title",
+                "body": "body"
+            }))
+        self.assertEqual(result.status, falcon.HTTP_201)
+        self.assertEqual(result.json["errors"], [])
+
+    def test_send_invalid_group_ids(self):
+        """groupIds must be a list of string or integer ids."""
+        for group_ids in ("group1", None, 1, [["group1"]], [None], [True]):
+            result = self.simulate_post("/v1/notifications", body=json.dumps({
+                    "groupIds": group_ids,
+                    "title": "title",
+                    "body": "body"
+                }))
+            self.assertEqual(result.status, falcon.HTTP_400, group_ids)
+        self.assertFalse(self._pushbullet.create_push.called)
+
+    def test_stream(self):
+        """Send notifications as a stream of NDJSON records."""
+        records = [{"username": "user1", "title": "t1", "body": "b1"},
+                   {"username": "user2", "title": "t2", "body": "b2"},
+                   {"username": "user1", "title": "t3", "body": "b3"}]
+        result = self.simulate_post(
+            "/v1/notifications/stream",
+            body="\n".join(json.dumps(r) for r in records) + "\n")
+        self.assertEqual(result.status, falcon.HTTP_200)
+
+        lines = [json.loads(line) for line in result.text.splitlines()]
+        self.assertEqual([(r["line"], r["username"], r["status"])
+                          for r in lines[:-1]],
+                         [(1, "user1", "ok"), (2, "user2", "ok"),
+                          (3, "user1", "ok")])
+        self.assertEqual(lines[-1], {"summary": {"sent": 3, "failed": 0}})
+        self._pushbullet.create_push.assert_any_call("code2", "t2", "b2")
+        user = self._storage.get_by_username("user1")
+        self.assertEqual(user["numOfNotificationsPushed"], 2)
+
+    def test_stream_errors(self):
+        """Invalid records are reported in order without stopping."""
+        body = "\n".join([
+            json.dumps({"username": "user3", "title": "t", "body": "b"}),
+            "not json",
+            "",
+            json.dumps({"username": "user1", "title": "t"}),
+            json.dumps({"username": "user1", "title": "t", "body": "b"}),
+        ])
+        result = self.simulate_post("/v1/notifications/stream", body=body)
+        lines = [json.loads(line) for line in result.text.splitlines()]
+        self.assertEqual([(r["line"], r["status"]) for r in lines[:-1]],
+                         [(1, "error"), (2, "error"), (4, "error"),
+                          (5, "ok")])
+        self.assertEqual(lines[-1], {"summary": {"sent": 1, "failed": 3}})
+        # Unknown users are not given a history.
+        self.assertEqual(self._history.get("user3"), (0, []))
+        self.assertEqual(self._history.get("user1")[0], 1)
+
+    def test_stream_unexpected_errors(self):
+        """Records of the wrong type and unexpected delivery errors are
+        reported, and the stream still ends with its summary."""
+        self._pushbullet.create_push.side_effect = [
+            ConnectionError("reset"), None]
+        body = "\n".join([
+            json.dumps({"username": ["user1"], "title": "t", "body": "b"}),
+            json.dumps({"username": "user1", "title": "t", "body": "b",
+                        "deviceIden": ["device1"]}),
+            json.dumps({"username": "user1", "title": "t", "body": "b"}),
+            json.dumps({"username": "user2", "title": "t", "body": "b"}),
+        ])
+        result = self.simulate_post("/v1/notifications/stream", body=body)
+        lines = [json.loads(line) for line in result.text.splitlines()]
+        self.assertEqual([(r["line"], r["status"]) for r in lines[:-1]],
+                         [(1, "error"), (2, "error"), (3, "error"),
+                          (4, "ok")])
+        self.assertEqual(lines[0]["error"], "Expected a string for 'username'")
+        self.assertEqual(lines[2]["error"], "user1: Delivery failed")
+        self.assertEqual(lines[-1], {"summary": {"sent": 1, "failed": 3}})
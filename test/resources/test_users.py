@@ -58,6 +58,12 @@ class TestUsers(testing.TestCase):
             {"username": "testuser"}))
         self.assertEqual(result.status, falcon.HTTP_400)
 
+    def test_register_invalid_username(self):
+        """Register with a username which is not a string."""
+        result = self.simulate_post('/v1/users', body=json.dumps(
+            {"username": 5, "accessToken": "testtoken"}))
+        self.assertEqual(result.status, falcon.HTTP_400)
+
     def test_register_duplicate_user(self):
         """Register the same user twice."""
         # Insert one validly
@@ -177,3 +183,103 @@ class TestUsers(testing.TestCase):
         self.assertEqual(result.status, falcon.HTTP_500)
         user = self._storage.get_by_username("user1")
         self.assertEqual(user["numOfNotificationsPushed"], 0)
+
+    def test_notify_device(self):
+        """Push a notification to one device."""
+        self._storage.register_user("user1", "token1")
+        self._pushbullet.list_devices.return_value = [
+            {"iden": "device1", "active": True}]
+        result = self.simulate_post(
+            "/v1/users/user1/notifications", body=json.dumps({
+                "title": "test_title", "body": "test_body",
+                "deviceIden": "device1"
+            })
+        )
+        self.assertEqual(result.status, falcon.HTTP_201)
+        self._pushbullet.create_push.assert_called_with(
+            "token1", "test_title", "test_body", "device1")
+
+    def test_notify_inactive_device(self):
+        """Push a notification to a device which is not active."""
+        self._storage.register_user("user1", "token1")
+        self._pushbullet.list_devices.return_value = [
+            {"iden": "device1", "active": False}]
+        result = self.simulate_post(
+            "/v1/users/user1/notifications", body=json.dumps({
+                "title": "test_title", "body": "test_body",
+                "deviceIden": "device1"
+            })
+        )
+        self.assertEqual(result.status, falcon.HTTP_400)
+        self.assertFalse(self._pushbullet.create_push.called)
+
+    def test_notify_invalid_device_iden(self):
+        """A deviceIden which is not a string is refused."""
+        self._storage.register_user("user1", "token1")
+        result = self.simulate_post(
+            "/v1/users/user1/notifications", body=json.dumps({
+                "title": "test_title", "body": "test_body",
+                "deviceIden": ["device1"]
+            })
+        )
+        self.assertEqual(result.status, falcon.HTTP_400)
+        self.assertFalse(self._pushbullet.create_push.called)
+
+    def test_list_devices(self):
+        """List a user's devices."""
+        self._storage.register_user("user1", "token1")
+        self._pushbullet.list_devices.return_value = [
+            {"iden": "device1", "nickname": "Phone", "active": True}]
+        result = self.simulate_get("/v1/users/user1/devices")
+        self.assertEqual(result.json, [{"iden": "device1",
+                                        "nickname": "Phone"}])
+
+    def test_notification_history(self):
+        """Sent and failed notifications are listed, most recent first."""
+        self._storage.register_user("user1", "token1")
+        for title in ("first", "second"):
+            self.simulate_post(
+                "/v1/users/user1/notifications", body=json.dumps({
+                    "title": title, "body": "test_body"
+                })
+            )
+        self._pushbullet.create_push.side_effect = PushbulletException("")
+        self.simulate_post(
+            "/v1/users/user1/notifications", body=json.dumps({
+                "title": "third", "body": "test_body"
+            })
+        )
+        result = self.simulate_get("/v1/users/user1/notifications/history")
+        self.assertEqual(result.status, falcon.HTTP_200)
+        self.assertEqual(result.json["total"], 3)
+        notifications = result.json["notifications"]
+        self.assertEqual([n["title"] for n in notifications],
+                         ["third", "second", "first"])
+        self.assertEqual([n["status"] for n in notifications],
+                         ["error", "ok", "ok"])
+        self.assertEqual(notifications[0]["error"],
+                         "user1: Pushbullet error")
+        self.assertGreaterEqual(notifications[1]["latencyMs"], 0)
+
+    def test_notification_history_pages(self):
+        """History is paginated with offset and limit."""
+        self._storage.register_user("user1", "token1")
+        for i in range(5):
+            self.simulate_post(
+                "/v1/users/user1/notifications", body=json.dumps({
+                    "title": str(i), "body": "test_body"
+                })
+            )
+        result = self.simulate_get("/v1/users/user1/notifications/history",
+                                   query_string="offset=1&limit=2")
+        self.assertEqual(result.json["total"], 5)
+        self.assertEqual([n["title"] for n in result.json["notifications"]],
+                         ["3", "2"])
+        result = self.simulate_get("/v1/users/user1/notifications/history",
+                                   query_string="limit=0")
+        self.assertEqual(result.status, falcon.HTTP_400)
+
+    def test_notification_history_missing_user(self):
+        """Get the history of a user that isn't registered."""
+        result = self.simulate_get("/v1/users/user1/notifications/history")
+        self.assertEqual(result.status, falcon.HTTP_404)
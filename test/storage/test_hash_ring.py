@@ -0,0 +1,40 @@
+import unittest
+from push_notifications.storage.hash_ring import HashRing
+
+
+class TestHashRing(unittest.TestCase):
+    def test_node_for(self):
+        """Keys always map to the same node."""
+        ring = HashRing(["node1", "node2", "node3"])
+        for i in range(100):
+            key = "user%d" % i
+            self.assertIn(ring.node_for(key), ["node1", "node2", "node3"])
+            self.assertEqual(ring.node_for(key), ring.node_for(key))
+
+    def test_spread(self):
+        """Keys are spread across all nodes."""
+        ring = HashRing(["node1", "node2", "node3"])
+        counts = {}
+        for i in range(3000):
+            node = ring.node_for("user%d" % i)
+            counts[node] = counts.get(node, 0) + 1
+        for count in counts.values():
+            self.assertGreater(count, 700)
+
+    def test_add_node(self):
+        """Adding a node only moves keys onto that node."""
+        ring = HashRing(["node1", "node2", "node3"])
+        before = {i: ring.node_for("user%d" % i) for i in range(1000)}
+        ring.add_node("node4")
+        moved = 0
+        for i, node in before.items():
+            after = ring.node_for("user%d" % i)
+            if after != node:
+                self.assertEqual(after, "node4")
+                moved += 1
+        self.assertLess(moved, 400)
+
+    def test_empty(self):
+        """An empty ring cannot place keys."""
+        with self.assertRaises(LookupError):
+            HashRing().node_for("user1")
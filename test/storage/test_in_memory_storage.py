@@ -1,4 +1,5 @@
 import unittest
+import threading
 from push_notifications.storage.in_memory_storage import InMemoryStorage
 from push_notifications.storage import UserNotFoundException, \
     DuplicateUserException, GroupNotFoundException, DuplicateGroupException
@@ -83,3 +84,55 @@ class TestInMemoryStorage(unittest.TestCase):
         self._storage.register_group("group1", [])
         with self.assertRaises(DuplicateGroupException):
             self._storage.register_group("group1", [])
+
+    def test_get_users_snapshot(self):
+        """Listings are not changed by later registrations."""
+        self._storage.register_user("user1", "code1")
+        users = self._storage.get_users()
+        self._storage.register_user("user2", "code2")
+        self.assertEqual(len(users), 1)
+        self.assertEqual(len(self._storage.get_users()), 2)
+
+    def test_register_group_atomic(self):
+        """A group that fails validation is not registered."""
+        self._storage.register_user("user1", "code1")
+        with self.assertRaises(UserNotFoundException):
+            self._storage.register_group("group1", ["user1", "user2"])
+        with self.assertRaises(GroupNotFoundException):
+            self._storage.get_group("group1")
+
+    def test_concurrent_increments(self):
+        """Increments from many threads are not lost."""
+        for i in range(4):
+            self._storage.register_user("user%d" % i, "code%d" % i)
+
+        def increment():
+            for i in range(1000):
+                self._storage.increment_notifications_pushed(
+                    "user%d" % (i % 4))
+        threads = [threading.Thread(target=increment) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for i in range(4):
+            user = self._storage.get_by_username("user%d" % i)
+            self.assertEqual(user["numOfNotificationsPushed"], 2000)
+
+    def test_concurrent_group_registration(self):
+        """Only one of several concurrent registrations of a group wins."""
+        results = []
+
+        def register():
+            try:
+                self._storage.register_group("group1", [])
+                results.append(True)
+            except DuplicateGroupException:
+                results.append(False)
+        threads = [threading.Thread(target=register) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 1)
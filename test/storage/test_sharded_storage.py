@@ -0,0 +1,171 @@
+import unittest
+import threading
+import http.client
+import json
+from push_notifications.storage.in_memory_storage import InMemoryStorage
+from push_notifications.storage.sharded_storage import ShardedStorage
+from push_notifications.storage.hash_ring import HashRing
+from push_notifications.storage.remote_storage import RemoteStorage
+from push_notifications.storage.node import make_server
+from push_notifications.storage import UserNotFoundException, \
+    DuplicateUserException, GroupNotFoundException
+
+
+class TestShardedStorage(unittest.TestCase):
+    def setUp(self):
+        self._nodes = {"node%d" % i: InMemoryStorage() for i in range(3)}
+        self._storage = ShardedStorage(self._nodes)
+        for i in range(30):
+            self._storage.register_user("user%d" % i, "code%d" % i)
+
+    def test_users_spread(self):
+        """Users are stored on the node the ring picks."""
+        for node in self._nodes.values():
+            self.assertGreater(len(node.get_users()), 0)
+        self.assertEqual(len(self._storage.get_users()), 30)
+        node = self._nodes[self._storage.node_name_for("user1")]
+        self.assertEqual(node.get_by_username("user1")["accessToken"],
+                         "code1")
+
+    def test_duplicate(self):
+        """Register a duplicate user."""
+        with self.assertRaises(DuplicateUserException):
+            self._storage.register_user("user1", "code1")
+
+    def test_increment(self):
+        """Increment a user's counter on its node."""
+        self.assertEqual(
+            self._storage.increment_notifications_pushed("user1"), 1)
+        self.assertEqual(self._storage.get_by_username("user1")
+                         ["numOfNotificationsPushed"], 1)
+
+    def test_groups(self):
+        """Groups may contain users from any node."""
+        users = ["user%d" % i for i in range(30)]
+        self._storage.register_group("group1", users)
+        self.assertEqual(self._storage.get_group("group1"), users)
+        self.assertEqual(len(self._storage.get_groups()), 1)
+        with self.assertRaises(GroupNotFoundException):
+            self._storage.get_group("group2")
+        with self.assertRaises(UserNotFoundException):
+            self._storage.register_group("group2", ["user1", "missing"])
+        with self.assertRaises(UserNotFoundException):
+            self._storage.register_group("group2", ["user1", 5])
+
+    def test_get_by_usernames(self):
+        """Several users are got at once from the nodes holding them."""
+        users = self._storage.get_by_usernames(["user1", "user2", "user99"])
+        self.assertEqual(sorted(users), ["user1", "user2"])
+        self.assertEqual(users["user2"]["accessToken"], "code2")
+
+    def test_partition(self):
+        """Users are partitioned by node."""
+        shards = self._storage.partition(["user%d" % i for i in range(30)])
+        self.assertEqual(sum(len(u) for u in shards.values()), 30)
+        for name, users in shards.items():
+            for user in users:
+                self.assertEqual(self._storage.node_name_for(user), name)
+
+    def test_add_node(self):
+        """Adding a node moves users and groups without losing counts."""
+        for i in range(30):
+            self._storage.increment_notifications_pushed("user%d" % i)
+        for i in range(10):
+            self._storage.register_group("group%d" % i, ["user%d" % i])
+
+        new_node = InMemoryStorage()
+        moved_users, moved_groups = self._storage.add_node("node3",
+                                                           new_node)
+        self.assertGreater(moved_users, 0)
+        self.assertEqual(len(new_node.get_users()), moved_users)
+        self.assertEqual(len(new_node.get_group_ids()), moved_groups)
+        self.assertEqual(len(self._storage.get_users()), 30)
+        for i in range(30):
+            user = self._storage.get_by_username("user%d" % i)
+            self.assertEqual(user["numOfNotificationsPushed"], 1)
+        for i in range(10):
+            self.assertEqual(self._storage.get_group("group%d" % i),
+                             ["user%d" % i])
+
+    def test_register_during_add_node(self):
+        """Users registered while a node is added are not lost."""
+        ring = HashRing(["node0", "node1", "node2", "node3"])
+        username = next("new%d" % i for i in range(1000)
+                        if ring.node_for("new%d" % i) == "node3")
+        copying = threading.Event()
+        registered = threading.Event()
+
+        class SlowNode(InMemoryStorage):
+            def import_user(self, user):
+                if not copying.is_set():
+                    copying.set()
+                    # Give the registration a chance to run during the copy.
+                    registered.wait(0.2)
+                return super().import_user(user)
+
+        def register():
+            copying.wait()
+            self._storage.register_user(username, "code")
+            registered.set()
+
+        thread = threading.Thread(target=register)
+        thread.start()
+        self._storage.add_node("node3", SlowNode())
+        thread.join()
+        self.assertEqual(self._storage.get_by_username(username)["username"],
+                         username)
+        self.assertEqual(self._storage.node_name_for(username), "node3")
+        self.assertEqual(len(self._storage.get_users()), 31)
+        with self.assertRaises(DuplicateUserException):
+            self._storage.register_user(username, "code")
+
+
+class TestRemoteStorage(unittest.TestCase):
+    def setUp(self):
+        self._server = make_server("127.0.0.1", 0)
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        self._storage = RemoteStorage(
+            "http://127.0.0.1:%d" % self._server.server_address[1])
+
+    def tearDown(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def test_register_get(self):
+        """Register and get a user on a node."""
+        self._storage.register_user("user1", "code1")
+        self.assertEqual(self._storage.get_by_username("user1")
+                         ["accessToken"], "code1")
+        self.assertEqual(
+            self._storage.increment_notifications_pushed("user1", 2), 2)
+        self.assertEqual(len(self._storage.get_users()), 1)
+        self.assertEqual(list(self._storage.get_by_usernames(
+            ["user1", "user2"])), ["user1"])
+
+    def test_exceptions(self):
+        """Storage exceptions are raised by the client."""
+        self._storage.register_user("user1", "code1")
+        with self.assertRaises(DuplicateUserException):
+            self._storage.register_user("user1", "code1")
+        with self.assertRaises(UserNotFoundException):
+            self._storage.get_by_username("user2")
+        with self.assertRaises(GroupNotFoundException):
+            self._storage.get_group("group1")
+
+    def test_keep_alive(self):
+        """Requests are served one after another on one connection, even
+        when a request's body is not read."""
+        connection = http.client.HTTPConnection(
+            "127.0.0.1", self._server.server_address[1], timeout=5)
+        body = json.dumps({"args": []})
+        for method, status in (("unknown", 404), ("get_users", 200),
+                               ("get_group_ids", 200)):
+            connection.request("POST", "/storage/%s" % method, body)
+            response = connection.getresponse()
+            response.read()
+            self.assertEqual(response.status, status)
+            self.assertEqual(response.version, 11)
+            self.assertFalse(response.will_close)
+        connection.close()
@@ -0,0 +1,53 @@
+import unittest
+from push_notifications.pushbullet_api import PushbulletAPI, \
+    InvalidAccessTokenException, PushbulletException
+from benchmarks.pushbullet_stub import PushbulletStub, StubConfig
+from benchmarks.harness import summarize
+
+
+class TestPushbulletStub(unittest.TestCase):
+    def test_create_push(self):
+        """Pushes to the stub succeed."""
+        with PushbulletStub() as stub:
+            PushbulletAPI(stub.url).create_push("token", "title", "body")
+            self.assertEqual(stub.stats()["requests"], 1)
+
+    def test_serve_forever(self):
+        """The stub can serve from a thread of the caller's choosing."""
+        import threading
+        stub = PushbulletStub()
+        thread = threading.Thread(target=stub.serve_forever)
+        thread.start()
+        PushbulletAPI(stub.url).create_push("token", "title", "body")
+        stub.stop()
+        thread.join()
+        self.assertEqual(stub.stats()["requests"], 1)
+
+    def test_invalid_token(self):
+        """Injected 401s raise InvalidAccessTokenException."""
+        with PushbulletStub(StubConfig(rate_401=1.0)) as stub:
+            with self.assertRaises(InvalidAccessTokenException):
+                PushbulletAPI(stub.url).create_push("token", "title", "body")
+            self.assertEqual(stub.stats()["401"], 1)
+
+    def test_rate_limited(self):
+        """Injected 429s raise PushbulletException."""
+        with PushbulletStub(StubConfig(rate_429=1.0)) as stub:
+            with self.assertRaises(PushbulletException):
+                PushbulletAPI(stub.url).create_push("token", "title", "body")
+
+    def test_server_error(self):
+        """Injected 5xx errors raise PushbulletException."""
+        with PushbulletStub(StubConfig(rate_5xx=1.0)) as stub:
+            with self.assertRaises(PushbulletException):
+                PushbulletAPI(stub.url).create_push("token", "title", "body")
+
+
+class TestHarness(unittest.TestCase):
+    def test_summarize(self):
+        """Summaries report throughput and percentiles."""
+        summary = summarize([i / 1000.0 for i in range(1, 101)], 2.0)
+        self.assertEqual(summary["requests"], 100)
+        self.assertEqual(summary["reqPerSec"], 50.0)
+        self.assertEqual(summary["p50Ms"], 50.0)
+        self.assertEqual(summary["p99Ms"], 99.0)
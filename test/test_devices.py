@@ -0,0 +1,130 @@
+import unittest
+import threading
+import time
+from unittest import mock
+from unittest.mock import MagicMock
+from push_notifications.devices import DeviceRegistry, \
+    DeviceNotFoundException
+
+
+class TestDeviceRegistry(unittest.TestCase):
+    def setUp(self):
+        self._pushbullet = MagicMock()
+        self._pushbullet.list_devices.return_value = [
+            {"iden": "device1", "active": True, "pushable": True},
+            {"iden": "device2", "active": False},
+            {"iden": "device3", "active": True, "pushable": False},
+        ]
+        self._scheduler = MagicMock()
+        self._registry = DeviceRegistry(self._pushbullet, self._scheduler,
+                                        ttl=100)
+
+    def test_get_devices(self):
+        """Only active, pushable devices are listed."""
+        devices = self._registry.get_devices("user1", "token1")
+        self.assertEqual(list(devices), ["device1"])
+        self._pushbullet.list_devices.assert_called_with("token1")
+
+    def test_get_device(self):
+        """Get a single device."""
+        device = self._registry.get_device("user1", "token1", "device1")
+        self.assertEqual(device["iden"], "device1")
+
+    def test_inactive_device(self):
+        """Inactive and unknown devices are not found."""
+        for iden in ("device2", "device3", "device4"):
+            with self.assertRaises(DeviceNotFoundException):
+                self._registry.get_device("user1", "token1", iden)
+
+    @mock.patch('time.monotonic')
+    def test_cached(self, monotonic):
+        """Devices are only fetched once within the refresh period."""
+        monotonic.return_value = 0
+        self._registry.get_devices("user1", "token1")
+        monotonic.return_value = 79
+        self._registry.get_devices("user1", "token1")
+        self.assertEqual(self._pushbullet.list_devices.call_count, 1)
+        self.assertFalse(self._scheduler.submit.called)
+
+    @mock.patch('time.monotonic')
+    def test_refresh_ahead(self, monotonic):
+        """Entries near expiry are served and refreshed once in the
+        background."""
+        monotonic.return_value = 0
+        self._registry.get_devices("user1", "token1")
+        monotonic.return_value = 90
+        self._registry.get_devices("user1", "token1")
+        self._registry.get_devices("user1", "token1")
+        self.assertEqual(self._pushbullet.list_devices.call_count, 1)
+        self.assertEqual(self._scheduler.submit.call_count, 1)
+
+    @mock.patch('time.monotonic')
+    def test_expired(self, monotonic):
+        """Expired entries are fetched again."""
+        monotonic.return_value = 0
+        self._registry.get_devices("user1", "token1")
+        monotonic.return_value = 100
+        self._registry.get_devices("user1", "token1")
+        self.assertEqual(self._pushbullet.list_devices.call_count, 2)
+
+    @mock.patch('time.monotonic')
+    def test_new_device(self, monotonic):
+        """A device added after the cache was filled is found by fetching
+        again, at most once per interval."""
+        monotonic.return_value = 0
+        self._registry.get_devices("user1", "token1")
+        self._pushbullet.list_devices.return_value.append(
+            {"iden": "device4", "active": True})
+        monotonic.return_value = 5
+        with self.assertRaises(DeviceNotFoundException):
+            self._registry.get_device("user1", "token1", "device4")
+        self.assertEqual(self._pushbullet.list_devices.call_count, 1)
+        monotonic.return_value = 20
+        device = self._registry.get_device("user1", "token1", "device4")
+        self.assertEqual(device["iden"], "device4")
+        self.assertEqual(self._pushbullet.list_devices.call_count, 2)
+        with self.assertRaises(DeviceNotFoundException):
+            self._registry.get_device("user1", "token1", "device5")
+        self.assertEqual(self._pushbullet.list_devices.call_count, 2)
+
+    def test_evict_least_recently_used(self):
+        """Only max_entries users are kept, evicting the least recently
+        used."""
+        registry = DeviceRegistry(self._pushbullet, self._scheduler,
+                                  ttl=100, max_entries=2)
+        registry.get_devices("user1", "token1")
+        registry.get_devices("user2", "token2")
+        registry.get_devices("user1", "token1")
+        registry.get_devices("user3", "token3")
+        self.assertEqual(self._pushbullet.list_devices.call_count, 3)
+        registry.get_devices("user1", "token1")
+        self.assertEqual(self._pushbullet.list_devices.call_count, 3)
+        registry.get_devices("user2", "token2")
+        self.assertEqual(self._pushbullet.list_devices.call_count, 4)
+
+    def test_single_fetch(self):
+        """Concurrent misses for a user wait for one fetch."""
+        devices = self._pushbullet.list_devices.return_value
+        release = threading.Event()
+
+        def list_devices(access_token):
+            release.wait(5)
+            return devices
+        self._pushbullet.list_devices.side_effect = list_devices
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            self._registry.get_devices("user1", "token1")))
+            for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while (self._registry._flights.get("user1") is None or
+               self._registry._flights["user1"].waiters < 5):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self._pushbullet.list_devices.call_count, 1)
+        self.assertEqual([list(r) for r in results], [["device1"]] * 5)
+        self.assertEqual(self._registry._flights, {})
@@ -0,0 +1,43 @@
+import json
+import os
+import tempfile
+import unittest
+from push_notifications.history import NotificationHistory, OK, ERROR
+
+
+class TestNotificationHistory(unittest.TestCase):
+    def test_bounded(self):
+        """Only the last entries are kept for each user."""
+        history = NotificationHistory(size=3)
+        for i in range(5):
+            history.record("user1", str(i), OK, 0.001)
+        history.record("user2", "other", ERROR, 0.002, "failed")
+        total, entries = history.get("user1")
+        self.assertEqual(total, 3)
+        self.assertEqual([e["title"] for e in entries], ["4", "3", "2"])
+        self.assertEqual(entries[0]["latencyMs"], 1.0)
+        total, entries = history.get("user2")
+        self.assertEqual(entries[0]["error"], "failed")
+
+    def test_pages(self):
+        """Pages are taken from the most recent entry."""
+        history = NotificationHistory(size=10)
+        for i in range(5):
+            history.record("user1", str(i), OK, 0)
+        self.assertEqual([e["title"] for e in history.get("user1", 3, 5)[1]],
+                         ["1", "0"])
+        self.assertEqual(history.get("user1", 6, 5), (5, []))
+        self.assertEqual(history.get("user2"), (0, []))
+
+    def test_spill(self):
+        """Every entry is appended to the spill file."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "history.ndjson")
+            history = NotificationHistory(size=1, spill_path=path)
+            history.record("user1", "first", OK, 0)
+            history.record("user1", "second", OK, 0)
+            history.flush()
+            with open(path) as spill:
+                entries = [json.loads(line) for line in spill]
+        self.assertEqual([(e["username"], e["title"]) for e in entries],
+                         [("user1", "first"), ("user1", "second")])
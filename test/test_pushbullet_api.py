@@ -11,7 +11,7 @@ class TestPushbulletAPI(unittest.TestCase):
     def setUp(self):
         self._api = PushbulletAPI("https://api.pushbullet.com/v2")
 
-    @mock.patch('requests.post')
+    @mock.patch('requests.Session.post')
     def test_create_push(self, post_mock):
         """Create a push."""
         post_mock.return_value = MagicMock(status_code=200)
@@ -27,7 +27,7 @@ class TestPushbulletAPI(unittest.TestCase):
         self.assertEqual(post_mock.call_args[1]["headers"]["Access-Token"],
                          'test_access_token')
 
-    @mock.patch('requests.post')
+    @mock.patch('requests.Session.post')
     def test_invalid_token(self, post_mock):
         """A push with invalid token raises exception."""
         post_mock.return_value = MagicMock(
@@ -38,7 +38,7 @@ class TestPushbulletAPI(unittest.TestCase):
             self._api.create_push(
                 "test_access_token", "test_title", "test_body")
 
-    @mock.patch('requests.post')
+    @mock.patch('requests.Session.post')
     def test_unknown_error(self, post_mock):
         """An unknown error raises exception."""
         post_mock.return_value = MagicMock(
@@ -48,3 +48,51 @@ class TestPushbulletAPI(unittest.TestCase):
         with self.assertRaises(PushbulletException):
             self._api.create_push(
                 "test_access_token", "test_title", "test_body")
+
+    @mock.patch('requests.Session.post')
+    def test_timeout(self, post_mock):
+        """Requests time out and connection errors raise exception."""
+        import requests
+        post_mock.side_effect = requests.Timeout("timed out")
+        api = PushbulletAPI("https://api.pushbullet.com/v2", timeout=2)
+
+        with self.assertRaises(PushbulletException):
+            api.create_push("test_access_token", "test_title", "test_body")
+        self.assertEqual(post_mock.call_args[1]["timeout"], 2)
+
+    @mock.patch('requests.Session.post')
+    def test_create_push_to_device(self, post_mock):
+        """Create a push to a single device."""
+        post_mock.return_value = MagicMock(status_code=200)
+        self._api.create_push("test_access_token", "test_title", "test_body",
+                              "test_device")
+
+        request_data = json.loads(post_mock.call_args[0][1])
+        self.assertEqual(request_data["device_iden"], 'test_device')
+
+    @mock.patch('requests.Session.get')
+    def test_list_devices(self, get_mock):
+        """List devices, following the cursor."""
+        get_mock.side_effect = [
+            MagicMock(status_code=200, json=lambda: {
+                "devices": [{"iden": "device1"}], "cursor": "next"}),
+            MagicMock(status_code=200, json=lambda: {
+                "devices": [{"iden": "device2"}]}),
+        ]
+        devices = self._api.list_devices("test_access_token")
+
+        self.assertEqual([d["iden"] for d in devices],
+                         ["device1", "device2"])
+        self.assertEqual(get_mock.call_args[0][0],
+                         'https://api.pushbullet.com/v2/devices')
+        self.assertEqual(get_mock.call_args[1]["params"]["cursor"], "next")
+
+    @mock.patch('requests.Session.get')
+    def test_list_devices_invalid_token(self, get_mock):
+        """Listing devices with an invalid token raises exception."""
+        get_mock.return_value = MagicMock(
+            status_code=401,
+            json=lambda: {"error": {"message": "Authentication error"}})
+
+        with self.assertRaises(InvalidAccessTokenException):
+            self._api.list_devices("test_access_token")
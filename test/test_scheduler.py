@@ -0,0 +1,115 @@
+import unittest
+import threading
+from unittest import mock
+from push_notifications.scheduler import DeliveryScheduler, URGENT, BULK, \
+    UnknownLaneException, parse_weights
+
+
+class TestDeliveryScheduler(unittest.TestCase):
+    def setUp(self):
+        # A single worker makes the dispatch order deterministic.
+        self._scheduler = DeliveryScheduler(workers=1)
+        self._order = []
+        self._gate = threading.Event()
+
+    def tearDown(self):
+        self._gate.set()
+        self._scheduler.shutdown()
+
+    def _block(self):
+        """Occupy the worker until the gate is opened."""
+        started = threading.Event()
+
+        def wait():
+            started.set()
+            self._gate.wait()
+        self._scheduler.submit(BULK, "blocker", wait)
+        started.wait()
+
+    def _record(self, name):
+        self._order.append(name)
+        return name
+
+    def test_submit_returns_result(self):
+        """Submit a job and get its result."""
+        future = self._scheduler.submit(URGENT, "user1", lambda a: a * 2, 21)
+        self.assertEqual(future.result(timeout=1), 42)
+
+    def test_submit_raises_exception(self):
+        """Exceptions in jobs are raised by the future."""
+        def fail():
+            raise ValueError("failed")
+        future = self._scheduler.submit(URGENT, "user1", fail)
+        with self.assertRaises(ValueError):
+            future.result(timeout=1)
+
+    def test_unknown_lane(self):
+        """Submit to a lane that doesn't exist."""
+        with self.assertRaises(UnknownLaneException):
+            self._scheduler.submit("missing", "user1", self._record, "a")
+
+    def test_urgent_preempts_bulk(self):
+        """Urgent jobs run before a fan-out that is already queued."""
+        self._block()
+        futures = [self._scheduler.submit(BULK, "group1", self._record,
+                                          "bulk%d" % i) for i in range(5)]
+        futures.append(self._scheduler.submit(URGENT, "user1", self._record,
+                                              "urgent"))
+        self._gate.set()
+        for future in futures:
+            future.result(timeout=1)
+        self.assertEqual(self._order[0], "urgent")
+
+    def test_fair_between_flows(self):
+        """Flows in the same lane take turns."""
+        self._block()
+        futures = [self._scheduler.submit(BULK, "group1", self._record, "a")
+                   for i in range(4)]
+        futures += [self._scheduler.submit(BULK, "group2", self._record, "b")
+                    for i in range(2)]
+        self._gate.set()
+        for future in futures:
+            future.result(timeout=1)
+        self.assertEqual(self._order, ["a", "b", "a", "b", "a", "a"])
+
+    def test_weighted_flows(self):
+        """A flow with a higher weight gets more turns per round."""
+        self._scheduler.set_weight("group1", 2)
+        self._block()
+        futures = [self._scheduler.submit(BULK, "group1", self._record, "a")
+                   for i in range(4)]
+        futures += [self._scheduler.submit(BULK, "group2", self._record, "b")
+                    for i in range(2)]
+        self._gate.set()
+        for future in futures:
+            future.result(timeout=1)
+        self.assertEqual(self._order, ["a", "a", "b", "a", "a", "b"])
+
+    def test_configured_weights(self):
+        """Weights can be configured from the environment."""
+        self.assertEqual(parse_weights("group:a=4; groups:a,b=2;"),
+                         {"group:a": 4, "groups:a,b": 2})
+        with self.assertRaises(ValueError):
+            parse_weights("group:a")
+        with mock.patch.dict("os.environ",
+                             {"DELIVERY_WEIGHTS": "group:a=3;group:b=1"}):
+            scheduler = DeliveryScheduler(workers=1)
+        self.assertEqual(scheduler.weights(), {"group:a": 3})
+
+    def test_stats(self):
+        """Queue depth is reported for each lane."""
+        self._block()
+        futures = [self._scheduler.submit(BULK, "group1", self._record, "a")
+                   for i in range(3)]
+        stats = self._scheduler.stats()
+        self.assertEqual(stats[BULK]["depth"], 3)
+        self.assertEqual(stats[URGENT]["depth"], 0)
+
+        self._gate.set()
+        for future in futures:
+            future.result(timeout=1)
+        self._scheduler.shutdown()
+        stats = self._scheduler.stats()
+        self.assertEqual(stats[BULK]["depth"], 0)
+        self.assertEqual(stats[BULK]["submitted"], 4)
+        self.assertEqual(stats[BULK]["completed"], 4)
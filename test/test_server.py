@@ -0,0 +1,22 @@
+import unittest
+import subprocess
+import sys
+from push_notifications import server
+
+
+class TestServer(unittest.TestCase):
+    def test_lazy_import(self):
+        """Importing the server does not import Falcon or requests."""
+        output = subprocess.check_output([
+            sys.executable, "-c",
+            "import sys, push_notifications.server; "
+            "print('falcon' in sys.modules, 'requests' in sys.modules)"])
+        self.assertEqual(output.decode("utf-8").strip(), "False False")
+
+    def test_module_api(self):
+        """The module level api is built once on first access."""
+        self.assertIs(server.api, server.api)
+
+    def test_create_app(self):
+        """The app factory builds a new app each time."""
+        self.assertIsNot(server.create_app(), server.create_app())
@@ -0,0 +1,105 @@
+import unittest
+import io
+import json
+import logging
+from unittest import mock
+from push_notifications.utils.log import JsonFormatter, SamplingFilter, \
+    BatchingQueueHandler, configure_logging, DELIVERY_LOGGER
+
+
+class Counted:
+    """An argument that counts how often it is formatted."""
+    def __init__(self):
+        self.formatted = 0
+
+    def __str__(self):
+        self.formatted += 1
+        return "counted"
+
+
+class TestLog(unittest.TestCase):
+    def setUp(self):
+        self._sink = io.StringIO()
+        self._logger = logging.getLogger("notifications_api")
+        self._saved = (self._logger.handlers[:], self._logger.level,
+                       self._logger.propagate)
+
+    def tearDown(self):
+        for handler in self._logger.handlers:
+            handler.close()
+        self._logger.handlers, self._logger.level, \
+            self._logger.propagate = self._saved
+        logging.getLogger(DELIVERY_LOGGER).filters = []
+
+    def test_json_formatter(self):
+        """Records are formatted as JSON including extra fields."""
+        record = logging.LogRecord("test", logging.INFO, __file__, 1,
+                                   "Pushed to %s", ("user1",), None)
+        record.username = "user1"
+        data = json.loads(JsonFormatter().format(record))
+        self.assertEqual(data["message"], "Pushed to user1")
+        self.assertEqual(data["level"], "INFO")
+        self.assertEqual(data["username"], "user1")
+
+    def test_sampling_filter(self):
+        """One in every n records is kept."""
+        sampling = SamplingFilter(3)
+        kept = [sampling.filter(None) for _ in range(9)]
+        self.assertEqual(kept.count(True), 3)
+
+    def test_batched_writes(self):
+        """Records are written to the sink by the background thread."""
+        handler = configure_logging(sink=self._sink)
+        logger = logging.getLogger("notifications_api.users")
+        for i in range(10):
+            logger.info("Message %d", i)
+        handler.flush()
+        lines = self._sink.getvalue().splitlines()
+        self.assertEqual([json.loads(line)["message"] for line in lines],
+                         ["Message %d" % i for i in range(10)])
+
+    def test_sampled_deliveries(self):
+        """Per-user delivery messages are sampled and never formatted
+        when dropped."""
+        handler = configure_logging(sink=self._sink, sample_every=5)
+        counted = Counted()
+        for i in range(10):
+            logging.getLogger(DELIVERY_LOGGER).info("Pushed to %s", counted)
+        handler.flush()
+        self.assertEqual(len(self._sink.getvalue().splitlines()), 2)
+        self.assertEqual(counted.formatted, 2)
+
+    def test_queue_full(self):
+        """Records are dropped rather than blocking when the queue is full."""
+        handler = BatchingQueueHandler(self._sink, max_queue=1)
+        handler._thread = object()  # Pretend the writer is busy.
+        record = logging.LogRecord("test", logging.INFO, __file__, 1,
+                                   "message", (), None)
+        handler.emit(record)
+        handler.emit(record)
+        self.assertEqual(handler.dropped, 1)
+        handler._thread = None
+
+    def test_sink_errors(self):
+        """A failing sink does not stop the writer or hang flush."""
+        class FailingSink(io.StringIO):
+            failures = 1
+
+            def write(self, text):
+                if self.failures:
+                    self.failures -= 1
+                    raise BrokenPipeError()
+                return super().write(text)
+
+        sink = FailingSink()
+        handler = BatchingQueueHandler(sink, flush_timeout=1)
+        handler.setFormatter(JsonFormatter())
+        record = logging.LogRecord("test", logging.INFO, __file__, 1,
+                                   "message", (), None)
+        with mock.patch.object(logging, "raiseExceptions", False):
+            handler.emit(record)
+            handler.flush()
+            handler.emit(record)
+            handler.flush()
+        handler.close()
+        self.assertEqual(len(sink.getvalue().splitlines()), 1)
@@ -0,0 +1,55 @@
+import unittest
+from push_notifications.utils.tracing import Tracer, span, traced, \
+    current_trace
+from push_notifications.scheduler import DeliveryScheduler, URGENT
+
+
+class TestTracer(unittest.TestCase):
+    def test_no_trace(self):
+        """Spans outside a trace are ignored."""
+        with span("phase"):
+            pass
+        self.assertIsNone(current_trace())
+
+    def test_sampled(self):
+        """Sampled requests are kept with their spans."""
+        tracer = Tracer(sample_rate=1.0)
+        state = tracer.start("GET", "/v1/users")
+        with span("phase"):
+            pass
+        traced("function")(lambda: None)()
+        tracer.finish(state, "200 OK")
+
+        self.assertIsNone(current_trace())
+        traces = tracer.traces()
+        self.assertEqual(len(traces), 1)
+        self.assertEqual([s["name"] for s in traces[0]["spans"]],
+                         ["phase", "function"])
+        self.assertEqual(traces[0]["status"], "200 OK")
+
+    def test_not_sampled(self):
+        """Requests that are not sampled or slow are discarded."""
+        tracer = Tracer(sample_rate=0.0, slow_ms=1000)
+        tracer.finish(tracer.start("GET", "/v1/users"), "200 OK")
+        self.assertEqual(tracer.traces(), [])
+
+    def test_slow_profiled(self):
+        """Slow requests are kept with a profile attached."""
+        tracer = Tracer(slow_ms=0, profile_slow=True)
+        tracer.finish(tracer.start("GET", "/v1/users"), "200 OK")
+        traces = tracer.traces()
+        self.assertEqual(len(traces), 1)
+        self.assertIn("function calls", traces[0]["profile"])
+
+    def test_scheduler_spans(self):
+        """Spans recorded by delivery jobs belong to the request trace."""
+        tracer = Tracer(sample_rate=1.0)
+        scheduler = DeliveryScheduler(workers=1)
+        state = tracer.start("POST", "/v1/users/user1/notifications")
+        scheduler.submit(URGENT, "user1",
+                         traced("create_push")(lambda: None)).result()
+        tracer.finish(state, "201 Created")
+        scheduler.shutdown()
+
+        names = [s["name"] for s in tracer.traces()[0]["spans"]]
+        self.assertEqual(names, ["scheduler.queue_wait", "create_push"])